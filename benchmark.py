@@ -0,0 +1,396 @@
+"""
+Benchmark suite for the stamping engine.
+
+Generates a synthetic corpus (mixed sizes, EXIF-rotated JPEGs, palette GIFs,
+RGBA PNGs), runs the engine under each requested backend and worker count,
+and prints a JSON report with images/s, per-image latency percentiles, peak
+RSS and a per-stage time breakdown.
+
+    python -m benchmark --workers 1,2,4,8 --backends thread,process
+    python -m benchmark --autotune
+    python -m benchmark --composite
+
+--autotune stores the fastest backend and worker count in settings.json.
+--composite instead times compositing alone on 12MP and 48MP frames, against
+the original compositing path.
+"""
+import os
+import sys
+import json
+import random
+import shutil
+import platform
+import argparse
+import tempfile
+import time
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+import PIL
+from PIL import Image
+import config
+import engine
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+# (width, height) of the generated photos, cycled through the corpus
+CORPUS_SIZES = [(1024, 768), (3000, 2000), (4000, 3000), (6000, 4000)]
+
+# Kinds of generated images, cycled through the corpus
+CORPUS_KINDS = ['jpeg', 'jpeg-rotated', 'gif-palette', 'png-rgba']
+
+# Frame sizes for the compositing micro-benchmark
+# Default corpus size: DEFAULT_COUNT images, or IMAGES_PER_WORKER per worker
+# for the largest worker count if that is more, so every worker has several
+# images and the timings measure steady-state throughput rather than ramp-up
+DEFAULT_COUNT = 24
+IMAGES_PER_WORKER = 8
+
+COMPOSITE_SIZES = {'12MP': (4000, 3000), '48MP': (8000, 6000)}
+
+
+def make_photo(size, rng):
+    """
+    Returns an RGB image with noise over a gradient, which compresses roughly
+    like a real photo (a flat color would make decode and encode unrealistically cheap).
+    """
+    noise = Image.effect_noise(size, rng.randint(20, 60))
+    gradient = Image.linear_gradient('L').resize(size)
+    channels = [Image.blend(noise, gradient, rng.random()) for _ in range(3)]
+    return Image.merge('RGB', channels)
+
+
+def generate_corpus(directory, count, seed=0):
+    """
+    Writes count synthetic images into directory. Returns a description of the corpus.
+    """
+    rng = random.Random(seed)
+    os.makedirs(directory, exist_ok=True)
+    kinds = {}
+    total_bytes = 0
+
+    for index in range(count):
+        kind = CORPUS_KINDS[index % len(CORPUS_KINDS)]
+        size = CORPUS_SIZES[(index // len(CORPUS_KINDS)) % len(CORPUS_SIZES)]
+        photo = make_photo(size, rng)
+
+        if kind == 'jpeg':
+            path = os.path.join(directory, f"photo_{index:05d}.jpg")
+            photo.save(path, quality=90)
+        elif kind == 'jpeg-rotated':
+            # Stored sideways with an orientation tag, as phones and cameras do
+            path = os.path.join(directory, f"rotated_{index:05d}.jpg")
+            exif = Image.Exif()
+            exif[0x0112] = 6
+            photo.transpose(Image.Transpose.ROTATE_90).save(path, quality=90, exif=exif)
+        elif kind == 'gif-palette':
+            path = os.path.join(directory, f"palette_{index:05d}.gif")
+            photo.resize((size[0] // 4, size[1] // 4)).quantize(256).save(path)
+        else:
+            path = os.path.join(directory, f"alpha_{index:05d}.png")
+            photo = photo.resize((size[0] // 2, size[1] // 2))
+            photo.putalpha(Image.linear_gradient('L').resize(photo.size))
+            photo.save(path, compress_level=1)
+
+        kinds[kind] = kinds.get(kind, 0) + 1
+        total_bytes += os.path.getsize(path)
+
+    return {'count': count, 'bytes': total_bytes, 'kinds': kinds}
+
+
+def generate_logo(path):
+    """
+    Writes a semi-transparent 600x200 logo to path.
+    """
+    logo = Image.new('RGBA', (600, 200), (255, 255, 255, 0))
+    logo.paste((200, 30, 30, 220), (20, 20, 580, 180))
+    logo.save(path)
+
+
+def peak_rss_mb():
+    """
+    Returns (this process, largest finished child process) peak resident
+    memory in MB; the child figure is None when no child has finished. These
+    are per process: the kernel doesn't report the peak of a process tree, so
+    with the process backend the total is roughly the first plus workers times
+    the second. (None, None) where the resource module is unavailable.
+    """
+    if resource is None:
+        return None, None
+    # ru_maxrss is in bytes on macOS and kilobytes elsewhere
+    unit = 1 if sys.platform == 'darwin' else 1024
+    own = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * unit
+    children = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss * unit
+    return round(own / 1e6, 1), (round(children / 1e6, 1) if children else None)
+
+
+def percentile(values, fraction):
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))]
+
+
+def run_configuration(settings):
+    """
+    Runs one engine configuration and returns its measurements. Meant to run
+    in a fresh process so peak RSS belongs to this configuration alone.
+    Process workers are started before the clock starts, so throughput
+    doesn't include interpreter start-up.
+    peak_rss_mb covers the process running the engine (all of the memory for
+    the thread and pipeline backends); with the process backend each worker
+    peaks at up to worker_peak_rss_mb on top of it.
+    """
+    latencies = []
+    stages = {}
+
+    def on_result(result):
+        latencies.append(result['latency'])
+        for stage, seconds in result['timings'].items():
+            stages[stage] = stages.get(stage, 0.0) + seconds
+
+    output_dir = tempfile.mkdtemp(prefix="imagestamper-bench-out-")
+    try:
+        summary = engine.StampEngine({**settings, 'output_dir': output_dir}, on_result=on_result, warm_up=True).run()
+    finally:
+        shutil.rmtree(output_dir, ignore_errors=True)
+    if summary is None:
+        raise RuntimeError(f"Benchmark run with {settings['backend']} backend could not start")
+
+    elapsed = max(summary['elapsed'], 1e-9)
+    peak_rss, worker_peak_rss = peak_rss_mb()
+    return {
+        'backend': settings['backend'],
+        'workers': settings['max_workers'],
+        'images': summary['processed'],
+        'failed': summary['failed'],
+        'elapsed_s': round(summary['elapsed'], 3),
+        'images_per_s': round((summary['processed'] + summary['failed']) / elapsed, 2),
+        'mb_per_s_read': round(summary['bytes_read'] / elapsed / 1e6, 2),
+        'mb_per_s_written': round(summary['bytes_written'] / elapsed / 1e6, 2),
+        'latency_p50_ms': round(percentile(latencies, 0.50) * 1000, 1) if latencies else None,
+        'latency_p95_ms': round(percentile(latencies, 0.95) * 1000, 1) if latencies else None,
+        'peak_rss_mb': peak_rss,
+        'worker_peak_rss_mb': worker_peak_rss,
+        # Summed over all images (and so over all workers), in seconds
+        'stage_seconds': {stage: round(seconds, 3) for stage, seconds in stages.items()}
+    }
+
+
+def run_isolated(settings):
+    """
+    Runs run_configuration in a new spawned process.
+    """
+    with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context('spawn')) as executor:
+        return executor.submit(run_configuration, settings).result()
+
+
+def default_worker_counts():
+    """
+    Powers of two up to the CPU count, plus the current heuristic.
+    """
+    cpu_count = multiprocessing.cpu_count() or 1
+    counts = {config.default_max_workers(), cpu_count}
+    count = 1
+    while count < cpu_count:
+        counts.add(count)
+        count *= 2
+    return sorted(counts)
+
+
+def run_benchmark(corpus_dir, logo_path, backends, worker_counts, base_settings, log):
+    results = []
+    for backend in backends:
+        for workers in worker_counts:
+            settings = {
+                **base_settings,
+                'input_dir': corpus_dir,
+                'logo_path': logo_path,
+                'backend': backend,
+                'max_workers': workers,
+                'incremental': False
+            }
+            log(f"Running {backend} backend with {workers} worker(s)...")
+            results.append(run_isolated(settings))
+            log(f"  {results[-1]['images_per_s']} images/s")
+    return results
+
+
+def legacy_composite(frame, logo, settings):
+    """
+    The original compositing path, for comparison: converts the frame to RGBA,
+    resizes the logo and rebuilds its opacity with a Python callback for every
+    image, composites onto a full-frame copy and converts back to RGB.
+    """
+    frame = frame.convert("RGBA")
+    logo_size = int(min(frame.size) * settings['logo_size_ratio'])
+    logo_resized = logo.resize((logo_size, int(logo_size / (logo.width / logo.height))), Image.Resampling.LANCZOS)
+    opacity = settings['opacity']
+    if opacity < 255:
+        alpha = logo_resized.split()[3]
+        alpha = alpha.point(lambda p: p * opacity // 255)
+        logo_resized.putalpha(alpha)
+    pos = engine.logo_position(settings['position'], frame.size, logo_resized.size)
+    composite = Image.new("RGBA", frame.size)
+    composite.paste(frame, (0, 0))
+    composite.paste(logo_resized, pos, logo_resized)
+    return composite.convert("RGB")
+
+
+def current_composite(frame, logo_cache, settings):
+    """
+    The engine's compositing path: a cached logo blended into its bounding box
+    in place.
+    """
+    logo = logo_cache.logo
+    logo_size = int(min(frame.size) * settings['logo_size_ratio'])
+    prepared = logo_cache.get((logo_size, int(logo_size / (logo.width / logo.height))), settings['opacity'])
+    pos = engine.logo_position(
+        settings['position'], frame.size, prepared[0].size, settings['margin'], settings['offset_x'], settings['offset_y']
+    )
+    engine.composite_logo(frame, prepared, pos)
+    return frame
+
+
+def run_composite_benchmark(settings, logo, repeats, log):
+    """
+    Times per-image compositing on each of COMPOSITE_SIZES for both paths.
+    Returns the median milliseconds per image and the speedup.
+    """
+    if settings['position'] == 'tile':
+        # The original path had no tile mode, so compare a single logo
+        log(f"Tile position has no legacy equivalent; timing the default '{config.DEFAULT_SETTINGS['position']}' position instead.")
+        settings = {**settings, 'position': config.DEFAULT_SETTINGS['position']}
+    rng = random.Random(0)
+    results = []
+    for name, size in COMPOSITE_SIZES.items():
+        log(f"Timing compositing on a {name} frame...")
+        frame = make_photo(size, rng)
+        logo_cache = engine.LogoCache(logo)
+        timings = {}
+        for label, composite in (('legacy', lambda: legacy_composite(frame, logo, settings)),
+                                 ('current', lambda: current_composite(frame, logo_cache, settings))):
+            seconds = []
+            for _ in range(repeats):
+                start = time.perf_counter()
+                composite()
+                seconds.append(time.perf_counter() - start)
+            timings[label] = percentile(seconds, 0.5)
+        results.append({
+            'frame': name,
+            'size': list(size),
+            'legacy_ms': round(timings['legacy'] * 1000, 2),
+            'current_ms': round(timings['current'] * 1000, 2),
+            'speedup': round(timings['legacy'] / max(timings['current'], 1e-9), 1)
+        })
+        log(f"  legacy {results[-1]['legacy_ms']} ms, current {results[-1]['current_ms']} ms per image")
+    return results
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog="imagestamper-benchmark", description="Benchmark the stamping engine.")
+    parser.add_argument('--count', type=int, help=f"Number of synthetic images to generate (default: {DEFAULT_COUNT}, or {IMAGES_PER_WORKER} per worker for the largest worker count if that is more)")
+    parser.add_argument('--corpus', help="Generate the corpus in this directory and keep it, instead of using a temporary one")
+    parser.add_argument('--workers', help="Comma-separated worker counts (default: powers of two up to the CPU count)")
+    parser.add_argument('--backends', default=','.join(config.BACKENDS), help="Comma-separated backends (default: all)")
+    parser.add_argument('-s', '--settings', dest='settings_path', help="settings.json for the stamping options and for --autotune (default: the app's settings)")
+    parser.add_argument('--output', help="Write the JSON report to this file instead of stdout")
+    parser.add_argument('--autotune', action='store_true', help="Save the fastest backend and worker count to settings.json")
+    parser.add_argument('--composite', action='store_true', help="Only time compositing on 12MP and 48MP frames, against the original path")
+    parser.add_argument('--repeats', type=int, default=10, help="Timed repetitions per frame for --composite (default: 10)")
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    log = lambda message: print(message, file=sys.stderr, flush=True)
+
+    backends = [b.strip() for b in args.backends.split(',') if b.strip()]
+    for backend in backends:
+        if backend not in config.BACKENDS:
+            log(f"Unknown backend '{backend}'. Choose from: {', '.join(config.BACKENDS)}.")
+            return 2
+    try:
+        worker_counts = [int(w) for w in args.workers.split(',')] if args.workers else default_worker_counts()
+    except ValueError:
+        log("--workers must be a comma-separated list of numbers.")
+        return 2
+
+    settings_path = args.settings_path or config.get_settings_path()
+    try:
+        settings = config.load_settings(settings_path)
+    except Exception as e:
+        log(f"Error loading settings: {e}")
+        return 1
+
+    if args.composite:
+        logo_dir = tempfile.mkdtemp(prefix="imagestamper-bench-logo-")
+        try:
+            logo_path = os.path.join(logo_dir, "logo.png")
+            generate_logo(logo_path)
+            logo = Image.open(logo_path).convert("RGBA")
+        finally:
+            shutil.rmtree(logo_dir, ignore_errors=True)
+        report = {'composite': run_composite_benchmark(settings, logo, args.repeats, log)}
+        write_report(report, args.output)
+        return 0
+
+    count = args.count or max(DEFAULT_COUNT, IMAGES_PER_WORKER * max(worker_counts))
+    if count < IMAGES_PER_WORKER * max(worker_counts):
+        log(f"Warning: {count} image(s) give {max(worker_counts)} workers fewer than {IMAGES_PER_WORKER} each; results will mostly measure ramp-up.")
+
+    corpus_dir = args.corpus or tempfile.mkdtemp(prefix="imagestamper-bench-")
+    logo_dir = tempfile.mkdtemp(prefix="imagestamper-bench-logo-")
+    try:
+        log(f"Generating {count} image(s) in {corpus_dir}...")
+        corpus = generate_corpus(corpus_dir, count)
+        logo_path = os.path.join(logo_dir, "logo.png")
+        generate_logo(logo_path)
+
+        results = run_benchmark(corpus_dir, logo_path, backends, worker_counts, settings, log)
+    finally:
+        if not args.corpus:
+            shutil.rmtree(corpus_dir, ignore_errors=True)
+        shutil.rmtree(logo_dir, ignore_errors=True)
+
+    best = max(results, key=lambda r: r['images_per_s'])
+    report = {
+        'machine': {
+            'cpu_count': multiprocessing.cpu_count(),
+            'platform': platform.platform(),
+            'python': platform.python_version(),
+            'pillow': PIL.__version__
+        },
+        'corpus': corpus,
+        'results': results,
+        'best': {'backend': best['backend'], 'workers': best['workers'], 'images_per_s': best['images_per_s']}
+    }
+
+    if args.autotune:
+        settings['backend'] = best['backend']
+        settings['max_workers'] = best['workers']
+        try:
+            config.save_settings(settings_path, settings)
+            log(f"Autotune: saved {best['backend']} backend with {best['workers']} worker(s) to {settings_path}")
+            report['autotune'] = {'settings_path': settings_path, 'backend': best['backend'], 'max_workers': best['workers']}
+        except Exception as e:
+            log(f"Error saving settings: {e}")
+
+    write_report(report, args.output)
+    return 0
+
+
+def write_report(report, output_path=None):
+    text = json.dumps(report, indent=4)
+    if output_path:
+        with open(output_path, 'w') as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+
+
+if __name__ == "__main__":
+    multiprocessing.freeze_support()
+    sys.exit(main())
@@ -0,0 +1,107 @@
+"""
+Headless command line entry point for ImageStamper.
+
+    python -m cli --input photos --output stamped --logo logo.png
+
+Options not given on the command line come from --settings (a settings.json
+file, same schema as the desktop app) or fall back to the defaults.
+"""
+import sys
+import signal
+import argparse
+import multiprocessing
+import config
+import engine
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(
+        prog="imagestamper",
+        description="Add a logo to every image in a directory."
+    )
+    parser.add_argument('-i', '--input', dest='input_dir', help="Input directory")
+    parser.add_argument('-o', '--output', dest='output_dir', help="Output directory")
+    parser.add_argument('-l', '--logo', dest='logo_path', help="Logo image file")
+    parser.add_argument('-p', '--position', choices=config.POSITIONS, help="Logo position")
+    parser.add_argument('-r', '--ratio', dest='logo_size_ratio', type=float, help="Logo size relative to the image's short edge (e.g. 0.15)")
+    parser.add_argument('--margin', type=int, help="Logo distance from the frame edges in pixels (default: 10)")
+    parser.add_argument('--offset-x', dest='offset_x', type=float, help="Move the logo right by this percentage of the image width (negative moves left)")
+    parser.add_argument('--offset-y', dest='offset_y', type=float, help="Move the logo down by this percentage of the image height (negative moves up)")
+    parser.add_argument('--tile-angle', dest='tile_angle', type=float, help="With --position tile, rotation of the repeated logos in degrees (default: 30)")
+    parser.add_argument('--tile-spacing', dest='tile_spacing', type=float, help="With --position tile, gap between logos as a fraction of their size (default: 0.5)")
+    parser.add_argument('--opacity', type=int, help="Logo opacity, 0 (transparent) to 255 (opaque)")
+    parser.add_argument('--max-dimension', dest='max_dimension', type=int, help="Downscale so the long edge is at most this many pixels (0 = original)")
+    parser.add_argument('-f', '--format', dest='output_format', choices=config.OUTPUT_FORMATS, help="Output format ('keep' writes each image in its source format)")
+    parser.add_argument('--quality', type=int, help="Quality for JPEG, WebP and AVIF output (1-100)")
+    parser.add_argument('--subsampling', dest='jpeg_subsampling', choices=config.JPEG_SUBSAMPLINGS, help="JPEG chroma subsampling")
+    parser.add_argument('--optimize', dest='jpeg_optimize', action='store_true', default=None, help="Optimize JPEG Huffman tables (smaller, slower)")
+    parser.add_argument('--progressive', dest='jpeg_progressive', action='store_true', default=None, help="Write progressive JPEGs")
+    parser.add_argument('--webp-method', dest='webp_method', type=int, choices=range(7), help="WebP effort, 0 (fast) to 6 (small)")
+    parser.add_argument('--lossless', dest='webp_lossless', action='store_true', default=None, help="Lossless WebP")
+    parser.add_argument('--avif-speed', dest='avif_speed', type=int, choices=range(11), help="AVIF speed, 0 (small) to 10 (fast)")
+    parser.add_argument('--keep-exif', dest='keep_exif', action='store_true', default=None, help="Copy EXIF metadata to the outputs")
+    parser.add_argument('--no-icc', dest='keep_icc_profile', action='store_false', default=None, help="Drop embedded ICC color profiles")
+    parser.add_argument('-R', '--recursive', action='store_true', default=None, help="Include subfolders, mirrored in the output directory")
+    parser.add_argument('--incremental', action='store_true', default=None, help="Skip images already stamped with the same inputs and settings (resumes interrupted runs)")
+    parser.add_argument('--content-hash', dest='incremental_content_hash', action='store_true', default=None, help="With --incremental, compare file contents instead of modification times")
+    parser.add_argument('--dedup', action='store_true', default=None, help="Stamp byte-identical sources once and hardlink (or copy) the outputs for the others")
+    parser.add_argument('--export-timings', dest='export_timings', choices=config.TIMINGS_FORMATS, help="Write per-image stage timings to the output directory as CSV or JSON")
+    parser.add_argument('--cancel-timeout', dest='cancel_timeout', type=float, help="On Ctrl+C, seconds to let running images finish before stopping them (default: 10)")
+    parser.add_argument('--memory-budget', dest='memory_budget_mb', type=int, help="Limit the estimated memory of the images processed at once, in MB; larger images run one at a time (0 = no limit)")
+    parser.add_argument('-w', '--workers', dest='max_workers', type=int, help="Number of workers (0 = automatic)")
+    parser.add_argument('-b', '--backend', choices=config.BACKENDS, help="Processing backend")
+    parser.add_argument('-s', '--settings', dest='settings_path', help="settings.json to read defaults from")
+    parser.add_argument('-q', '--quiet', action='store_true', help="Don't print a line for every stamped or linked image")
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+
+    try:
+        settings = config.load_settings(args.settings_path) if args.settings_path else dict(config.DEFAULT_SETTINGS)
+    except Exception as e:
+        print(f"Error loading settings: {e}", file=sys.stderr)
+        return 1
+
+    # Command line arguments override the settings file
+    for key, value in vars(args).items():
+        if key in settings and value is not None:
+            settings[key] = value
+
+    for key, flag in (('input_dir', '--input'), ('output_dir', '--output'), ('logo_path', '--logo')):
+        if not settings[key]:
+            print(f"Error: {flag} is required (or set '{key}' in the settings file).", file=sys.stderr)
+            return 2
+
+    def log(message):
+        if not args.quiet or not message.startswith(("✅", "🔗")):
+            print(message, flush=True)
+
+    stamp_engine = engine.StampEngine(settings, log=log)
+
+    def on_interrupt(signum, frame):
+        # The first Ctrl+C stops the run gracefully, a second one immediately
+        signal.signal(signal.SIGINT, signal.default_int_handler)
+        print("Cancelling... (press Ctrl+C again to stop immediately)", file=sys.stderr, flush=True)
+        stamp_engine.cancel()
+
+    signal.signal(signal.SIGINT, on_interrupt)
+    summary = stamp_engine.run()
+    if summary is None:
+        return 1
+
+    if summary['stopped']:
+        print(f"🛑 Processing cancelled: {engine.format_summary(summary)}.")
+        return 130
+    if summary['aborted']:
+        print(f"❌ Processing aborted: {engine.format_summary(summary)}.")
+        return 1
+    print(f"🎉 Processing completed: {engine.format_summary(summary)}.")
+    return 1 if summary['failed'] else 0
+
+
+if __name__ == "__main__":
+    # Required for the process backend in frozen executables
+    multiprocessing.freeze_support()
+    sys.exit(main())
@@ -0,0 +1,127 @@
+"""
+The settings.json schema and the helpers to find, read and write it, shared
+by the desktop app, the command line and the engine. This module must stay
+cheap to import (no Pillow, no worker pools) so the desktop app can build its
+window before the processing stack is loaded.
+"""
+import os
+import json
+import appdirs
+
+# Available processing backends. Threads share one interpreter (and the GIL),
+# processes give each worker its own interpreter at the cost of IPC, and the
+# pipeline overlaps reads and writes with decoding for slow (network) storage.
+BACKENDS = ['thread', 'process', 'pipeline']
+
+# 'tile' repeats the logo, rotated by tile_angle degrees, across the whole frame
+POSITIONS = ['bottom-right', 'bottom-left', 'top-right', 'top-left', 'center', 'tile']
+
+# Formats selectable in the GUI / settings.json. 'keep' writes each image in
+# its source format. 'avif' needs a Pillow build that can write AVIF (see
+# encoders.available_formats).
+OUTPUT_FORMATS = ['jpeg', 'webp', 'avif', 'keep']
+
+# Formats for the per-image timings export ('' disables it). The file is
+# written to the output directory.
+TIMINGS_FORMATS = ['csv', 'json']
+
+# JPEG chroma subsampling choices for 'jpeg_subsampling'
+JPEG_SUBSAMPLINGS = ['4:4:4', '4:2:2', '4:2:0']
+
+# Settings read by the encoders, with defaults. 'quality' is shared by the
+# lossy formats.
+ENCODER_SETTINGS = {
+    'output_format': 'jpeg',
+    'quality': 100,
+    'jpeg_subsampling': '4:2:0',
+    'jpeg_optimize': False,
+    'jpeg_progressive': False,
+    'webp_method': 4,
+    'webp_lossless': False,
+    'avif_speed': 6,
+    'keep_icc_profile': True,
+    'keep_exif': False
+}
+
+# The settings.json schema, with default values. A max_workers of 0 means
+# "pick automatically from the CPU count", and a memory_budget_mb of 0 means no
+# memory limit on the images processed at once. margin is the logo's distance from
+# the frame edges in pixels; offset_x / offset_y then move it by a percentage
+# of the frame's width / height (positive is right / down). In tile mode,
+# tile_spacing is the gap between logos as a fraction of the rotated logo's size.
+DEFAULT_SETTINGS = {
+    'input_dir': '',
+    'output_dir': '',
+    'logo_path': '',
+    'position': 'bottom-right',
+    'logo_size_ratio': 0.15,
+    'opacity': 128,
+    'max_dimension': 0,
+    'margin': 10,
+    'offset_x': 0.0,
+    'offset_y': 0.0,
+    'tile_angle': 30,
+    'tile_spacing': 0.5,
+    'backend': 'thread',
+    'max_workers': 0,
+    'recursive': False,
+    'incremental': False,
+    'incremental_content_hash': False,
+    'dedup': False,
+    'export_timings': '',
+    'cancel_timeout': 10,
+    'memory_budget_mb': 0,
+    'profiles': [],
+    **ENCODER_SETTINGS
+}
+
+
+def get_settings_path():
+    """
+    Returns the path to settings.json in the user's config directory,
+    creating the directory if needed.
+    """
+    settings_dir = appdirs.user_config_dir("ImageStamper", "maplenetwork")
+    os.makedirs(settings_dir, exist_ok=True)
+    return os.path.join(settings_dir, "settings.json")
+
+
+def load_settings(settings_path):
+    """
+    Reads settings.json and returns it merged over DEFAULT_SETTINGS.
+    Missing files give the defaults; invalid files raise.
+    """
+    settings = dict(DEFAULT_SETTINGS)
+    if os.path.exists(settings_path):
+        with open(settings_path, 'r') as f:
+            settings.update(json.load(f))
+    return settings
+
+
+def save_settings(settings_path, settings):
+    """
+    Writes settings.json atomically: the settings go to a temporary file that
+    then replaces the old one, so a crash or a concurrent save never leaves a
+    truncated file behind.
+    """
+    temp_path = f"{settings_path}.{os.getpid()}.tmp"
+    try:
+        with open(temp_path, 'w') as f:
+            json.dump(settings, f, indent=4)
+        os.replace(temp_path, settings_path)
+    except BaseException:
+        try:
+            os.remove(temp_path)
+        except OSError:
+            pass
+        raise
+
+
+def default_max_workers():
+    """
+    Heuristic worker count: three quarters of the CPUs, between 1 and 32.
+    """
+    cpu_count = (os.cpu_count() or 1)
+    min_cores = 1
+    max_cores = 32
+    return max(min_cores, min(round(cpu_count - cpu_count / 4), max_cores))
@@ -0,0 +1,101 @@
+"""
+Output encoders: picks the output format for each image and the Pillow save
+options for it, including ICC profile and EXIF passthrough.
+"""
+import os
+import functools
+from PIL import Image
+from config import OUTPUT_FORMATS
+
+# Pillow format name and file extension for each selectable format
+FORMAT_NAMES = {'jpeg': 'JPEG', 'webp': 'WEBP', 'avif': 'AVIF'}
+FORMAT_EXTENSIONS = {'JPEG': '.jpg', 'WEBP': '.webp', 'AVIF': '.avif'}
+
+# Output formats that can store transparency
+ALPHA_FORMATS = {'PNG', 'WEBP', 'AVIF', 'GIF', 'TIFF'}
+
+# Formats whose Pillow writer accepts icc_profile / exif arguments
+ICC_FORMATS = {'JPEG', 'WEBP', 'AVIF', 'PNG', 'TIFF'}
+EXIF_FORMATS = {'JPEG', 'WEBP', 'AVIF', 'PNG'}
+
+
+@functools.lru_cache(maxsize=None)
+def avif_supported():
+    """
+    True if Pillow can write AVIF, either natively (Pillow 11.2+) or through
+    the optional pillow-avif-plugin package.
+    """
+    try:
+        import pillow_avif  # noqa: F401 (registers the AVIF plugin with Pillow)
+    except ImportError:
+        pass
+    Image.init()
+    return 'AVIF' in Image.SAVE
+
+
+def available_formats():
+    return [f for f in OUTPUT_FORMATS if f != 'avif' or avif_supported()]
+
+
+def resolve_output(output_format, source_format, filename):
+    """
+    Returns (pillow_format, output_filename) for a source image.
+    """
+    base_filename, extension = os.path.splitext(filename)
+    if output_format == 'keep':
+        # Multi-picture JPEGs (from many cameras) open as MPO; write them as JPEG
+        if source_format == 'MPO':
+            source_format = 'JPEG'
+        if source_format in Image.SAVE:
+            return source_format, base_filename + extension
+        return 'JPEG', f"{base_filename}.jpg"
+
+    pil_format = FORMAT_NAMES.get(output_format)
+    if pil_format is None:
+        raise ValueError(f"Unknown output format '{output_format}'")
+    if pil_format == 'AVIF' and not avif_supported():
+        raise ValueError("AVIF output is not supported by this Pillow installation")
+    return pil_format, base_filename + FORMAT_EXTENSIONS[pil_format]
+
+
+def target_mode(pil_format, image):
+    """
+    Returns the mode an image should be composited and saved in: RGBA when the
+    source has transparency and the output can keep it, RGB otherwise.
+    """
+    has_alpha = image.mode in ('RGBA', 'LA', 'PA') or (image.mode == 'P' and 'transparency' in image.info)
+    if has_alpha and pil_format in ALPHA_FORMATS:
+        return 'RGBA'
+    return 'RGB'
+
+
+def save_options(pil_format, settings, icc_profile=None, exif=None):
+    """
+    Returns the keyword arguments for Image.save for the given format.
+    """
+    options = {}
+    if pil_format == 'JPEG':
+        options['quality'] = settings['quality']
+        options['subsampling'] = settings['jpeg_subsampling']
+        options['optimize'] = settings['jpeg_optimize']
+        options['progressive'] = settings['jpeg_progressive']
+    elif pil_format == 'WEBP':
+        options['quality'] = settings['quality']
+        options['method'] = settings['webp_method']
+        options['lossless'] = settings['webp_lossless']
+    elif pil_format == 'AVIF':
+        options['quality'] = settings['quality']
+        options['speed'] = settings['avif_speed']
+
+    if icc_profile and settings['keep_icc_profile'] and pil_format in ICC_FORMATS:
+        options['icc_profile'] = icc_profile
+    if exif and settings['keep_exif'] and pil_format in EXIF_FORMATS:
+        options['exif'] = exif
+    return options
+
+
+def save_image(image, output_file, pil_format, settings, icc_profile=None, exif=None):
+    """
+    Encodes image into output_file (a path or binary file object).
+    """
+    image.save(output_file, format=pil_format, **save_options(pil_format, settings, icc_profile, exif))
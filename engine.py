@@ -0,0 +1,1520 @@
+"""
+GUI-free stamping engine shared by the desktop app (main.py) and the command
+line (cli.py). This module must not import tkinter so headless batch runs
+start quickly.
+"""
+import os
+import io
+import csv
+import json
+import math
+import shutil
+import time
+import queue
+import functools
+import signal
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future, CancelledError, ThreadPoolExecutor, ProcessPoolExecutor, wait, FIRST_COMPLETED
+import multiprocessing
+from PIL import Image, ImageOps
+import encoders
+from config import BACKENDS, DEFAULT_SETTINGS, ENCODER_SETTINGS, TIMINGS_FORMATS, default_max_workers
+from manifest import Manifest, hash_file, hash_settings
+
+SUPPORTED_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.bmp', '.gif')
+
+# How many tasks may be queued per worker before submission pauses. Keeps the
+# number of live futures bounded no matter how many files are in the batch.
+TASKS_PER_WORKER = 4
+
+# Maximum number of prepared logos kept per cache. Batches usually contain only
+# a handful of distinct resolutions, so this rarely evicts anything.
+LOGO_CACHE_SIZE = 32
+
+# Maximum number of rendered tile patterns kept per cache. Patterns are as
+# large as the frame, but a batch rarely has more than a couple of sizes
+# (e.g. landscape and portrait). With a memory budget each cache keeps only the
+# latest pattern, which the budget reserves for (see StampEngine.run_tasks).
+TILE_CACHE_SIZE = 4
+
+# Stages of stamp_image, in order, as reported in per-image timings. 'read'
+# (prefetching the raw file) is only reported by the pipeline backend.
+STAGES = ['read', 'open', 'decode', 'exif_transpose', 'resize', 'logo', 'composite', 'encode', 'write']
+
+# Pipeline backend: I/O threads for reading and for writing, and how many
+# images may wait between stages per decode worker.
+PIPELINE_READERS = 4
+PIPELINE_WRITERS = 2
+PIPELINE_BUFFERED_PER_WORKER = 2
+
+# Bytes per pixel of a decoded frame. Pillow stores RGB with a padding byte,
+# so RGB and RGBA frames take the same space.
+FRAME_BYTES_PER_PIXEL = 4
+
+# Seconds between checks for cancellation while waiting on results
+CANCEL_POLL_INTERVAL = 0.2
+
+# Suffix of outputs still being written. Outputs are written under a temporary
+# name and renamed when complete, so an interrupted write never leaves a
+# truncated image behind.
+PARTIAL_SUFFIX = ".imagestamper-partial"
+
+# Minimum seconds between live ('stats', ...) progress events
+STATS_INTERVAL = 0.5
+
+# Base name of the per-image timings export (see config.TIMINGS_FORMATS),
+# written to the output directory
+TIMINGS_FILENAME = "imagestamper-timings"
+
+# Settings that change how an output looks. Incremental runs re-stamp every
+# image when any of these change.
+OUTPUT_SETTINGS = ['position', 'logo_size_ratio', 'opacity', 'max_dimension', 'margin', 'offset_x', 'offset_y', 'tile_angle', 'tile_spacing', *ENCODER_SETTINGS]
+
+# Settings a stamp profile may set. 'profiles' is a list of dicts with any of
+# these keys; the rest come from the top-level settings. Each source is
+# decoded once and written once per profile, to the subdirectory 'subdir'
+# (default: the profile's name) of the output directory.
+PROFILE_SETTINGS = ['name', 'subdir', 'logo_path', *OUTPUT_SETTINGS]
+
+
+def scan_images(input_dir, recursive=False, exclude_dir=None, on_error=None):
+    """
+    Lazily yields the paths of supported images under input_dir, relative to it.
+    Uses os.scandir so most entries need no extra stat call. Subdirectories are
+    walked when recursive is set, except exclude_dir (e.g. an output directory
+    nested inside the input). Unreadable subdirectories are reported through
+    on_error(path, exception) and skipped.
+    """
+    exclude_dir = os.path.realpath(exclude_dir) if exclude_dir else None
+    pending = ['']
+    while pending:
+        relative_dir = pending.pop()
+        directory = os.path.join(input_dir, relative_dir)
+        try:
+            with os.scandir(directory) as entries:
+                for entry in entries:
+                    relative_path = os.path.join(relative_dir, entry.name)
+                    if entry.name.lower().endswith(SUPPORTED_EXTENSIONS) and entry.is_file():
+                        yield relative_path
+                    elif recursive and entry.is_dir(follow_symlinks=False):
+                        if exclude_dir is None or os.path.realpath(entry.path) != exclude_dir:
+                            pending.append(relative_path)
+        except OSError as e:
+            if not relative_dir:
+                raise
+            if on_error is not None:
+                on_error(directory, e)
+
+
+@functools.lru_cache(maxsize=None)
+def opacity_lut(opacity):
+    """
+    Returns the 256-entry lookup table that scales an alpha channel by
+    opacity / 255, built once per opacity and applied by Image.point in C.
+    """
+    return [p * opacity // 255 for p in range(256)]
+
+
+class DuplicateIndex:
+    """
+    Finds sources with identical content, for dedup runs. A file is only
+    hashed once another file of the same size turns up, so sources with a
+    unique size are never read here.
+    """
+
+    def __init__(self):
+        # size -> {content hash: first source}; None keys a source not hashed yet
+        self.by_size = {}
+
+    def find(self, input_path, size, content_hash=None):
+        """
+        Returns the first source seen with the same content as input_path, or
+        None (remembering input_path) if there is none. content_hash may be
+        passed when it is already known. Raises OSError if input_path can't
+        be read.
+        """
+        known = self.by_size.get(size)
+        if known is None:
+            self.by_size[size] = {None: input_path}
+            return None
+        if None in known:
+            first = known.pop(None)
+            try:
+                known[hash_file(first)] = first
+            except OSError:
+                # The earlier source is no longer readable; its own task reports that
+                pass
+        content_hash = content_hash or hash_file(input_path)
+        original = known.get(content_hash)
+        if original is None:
+            known[content_hash] = input_path
+        return original
+
+
+class LogoCache:
+    """
+    Thread-safe, bounded LRU cache of prepared logos (resized, with opacity
+    already applied), keyed by (logo_size, opacity). Each entry is an
+    (RGB image, alpha mask, RGBA image) tuple ready to be blended onto an RGB
+    or RGBA frame by composite_logo. Rendered tile patterns are kept in a
+    second, smaller LRU keyed by frame size as well.
+    """
+
+    def __init__(self, logo, max_entries=LOGO_CACHE_SIZE, max_tiles=TILE_CACHE_SIZE):
+        self.logo = logo
+        self.max_entries = max_entries
+        self.max_tiles = max_tiles
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._tiles = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, logo_size, opacity):
+        """
+        Returns the prepared (rgb, mask, rgba) logo for the given size and opacity,
+        preparing it on a miss. The returned images are shared and must not be
+        modified.
+        """
+        return self._lookup(self._entries, self.max_entries, self.prepare, logo_size, opacity)
+
+    def get_tile(self, frame_size, logo_size, opacity, angle, spacing):
+        """
+        Returns the tile pattern for a frame size, in the same form as get(),
+        rendering it on a miss. The returned images are shared and must not be
+        modified.
+        """
+        return self._lookup(self._tiles, self.max_tiles, self.prepare_tile, frame_size, logo_size, opacity, angle, spacing)
+
+    def _lookup(self, entries, max_entries, prepare, *key):
+        with self._lock:
+            prepared = entries.get(key)
+            if prepared is not None:
+                entries.move_to_end(key)
+                self.hits += 1
+                return prepared
+            self.misses += 1
+
+        # Prepare outside the lock so other threads are not blocked on the resize
+        prepared = prepare(*key)
+
+        with self._lock:
+            entries[key] = prepared
+            entries.move_to_end(key)
+            while len(entries) > max_entries:
+                entries.popitem(last=False)
+        return prepared
+
+    def prepare(self, logo_size, opacity):
+        logo_resized = self.logo.resize(logo_size, Image.Resampling.LANCZOS)
+
+        # Adjust logo opacity
+        if opacity < 255:
+            alpha = logo_resized.getchannel("A").point(opacity_lut(opacity))
+            logo_resized.putalpha(alpha)
+
+        # Split once here so compositing is a single masked paste per image
+        return logo_resized.convert("RGB"), logo_resized.getchannel("A"), logo_resized
+
+    def prepare_tile(self, frame_size, logo_size, opacity, angle, spacing):
+        """
+        Renders the logo, rotated by angle degrees, repeated across a
+        transparent frame-sized pattern in staggered rows.
+        """
+        logo_rgba = self.get(logo_size, opacity)[2]
+        tile = logo_rgba.rotate(angle, Image.Resampling.BICUBIC, expand=True)
+        # Steps of at least the tile size, so tiles never overlap and plain
+        # pastes are enough
+        step_x = max(1, round(tile.width * (1 + max(0.0, spacing))))
+        step_y = max(1, round(tile.height * (1 + max(0.0, spacing))))
+
+        pattern = Image.new("RGBA", frame_size, (0, 0, 0, 0))
+        for row, y in enumerate(range(0, frame_size[1], step_y)):
+            # Shift every other row by half a step for a diagonal layout
+            for x in range(-(step_x // 2) * (row % 2), frame_size[0], step_x):
+                pattern.paste(tile, (x, y))
+
+        # The RGBA pattern is pasted as its own mask onto RGB frames too,
+        # which avoids keeping frame-sized RGB and mask copies
+        return pattern, pattern, pattern
+
+    def stats(self):
+        with self._lock:
+            return self.hits, self.misses
+
+
+class StageTimer:
+    """
+    Adds the time since the previous lap to timings[stage], so stamp_image can
+    report where each image spent its time.
+    """
+
+    def __init__(self, timings):
+        self.timings = timings
+        self.last = time.perf_counter()
+
+    def lap(self, stage):
+        now = time.perf_counter()
+        self.timings[stage] = self.timings.get(stage, 0.0) + now - self.last
+        self.last = now
+
+
+class RunStats:
+    """
+    Aggregates per-image results into live throughput figures and per-worker
+    stage totals. Only used from the thread that calls StampEngine.run().
+    """
+
+    def __init__(self):
+        self.start_time = time.perf_counter()
+        self.completed = 0
+        self.bytes_read = 0
+        self.bytes_written = 0
+        self.stage_totals = {}
+        self.workers = {}
+
+    def add(self, result):
+        self.completed += 1
+        self.bytes_read += result['bytes_read']
+        self.bytes_written += result['bytes_written']
+        worker = self.workers.setdefault(result['worker'], {'images': 0, 'busy': 0.0, 'stages': {}})
+        worker['images'] += 1
+        # Stage time rather than latency, which includes queue waits in the pipeline
+        worker['busy'] += sum(result['timings'].values())
+        for stage, seconds in result['timings'].items():
+            self.stage_totals[stage] = self.stage_totals.get(stage, 0.0) + seconds
+            worker['stages'][stage] = worker['stages'].get(stage, 0.0) + seconds
+
+    def slowest_stage(self, stages=None):
+        """
+        Returns (stage, share of total stage time) for the stage that took the
+        most time, or (None, 0.0) before any image has finished.
+        """
+        stages = self.stage_totals if stages is None else stages
+        total = sum(stages.values())
+        if not total:
+            return None, 0.0
+        stage = max(stages, key=stages.get)
+        return stage, stages[stage] / total
+
+    def snapshot(self, remaining=None):
+        """
+        Returns live figures for display. remaining is the number of images
+        still to process, or None while the total is unknown.
+        """
+        elapsed = max(time.perf_counter() - self.start_time, 1e-9)
+        images_per_s = self.completed / elapsed
+        slowest_stage, slowest_share = self.slowest_stage()
+        return {
+            'elapsed': elapsed,
+            'images_per_s': images_per_s,
+            'mb_read_per_s': self.bytes_read / elapsed / 1e6,
+            'mb_written_per_s': self.bytes_written / elapsed / 1e6,
+            'eta': remaining / images_per_s if remaining is not None and images_per_s else None,
+            'slowest_stage': slowest_stage,
+            'slowest_share': slowest_share
+        }
+
+
+def format_stats(stats):
+    """
+    Returns a one-line status for a live stats snapshot.
+    """
+    parts = [
+        f"{stats['images_per_s']:.1f} images/s",
+        f"{stats['mb_read_per_s']:.1f} MB/s read",
+        f"{stats['mb_written_per_s']:.1f} MB/s written"
+    ]
+    if stats['eta'] is not None:
+        minutes, seconds = divmod(int(stats['eta']), 60)
+        hours, minutes = divmod(minutes, 60)
+        parts.append(f"ETA {hours}:{minutes:02d}:{seconds:02d}")
+    if stats['slowest_stage']:
+        parts.append(f"slowest stage: {stats['slowest_stage']} ({stats['slowest_share']:.0%})")
+    return " | ".join(parts)
+
+
+class TimingsExporter:
+    """
+    Streams per-image timings to a CSV or JSON file as results arrive, so
+    memory does not grow with the number of images.
+    """
+
+    def __init__(self, path, timings_format):
+        self.timings_format = timings_format
+        self.file = open(path, 'w', newline='', encoding='utf-8')
+        self.rows = 0
+        if timings_format == 'csv':
+            self.writer = csv.writer(self.file)
+            self.writer.writerow(['source', 'outputs', 'ok', 'worker', 'bytes_read', 'bytes_written', 'latency', *STAGES])
+        else:
+            self.file.write("[\n")
+
+    def add(self, result):
+        timings = result['timings']
+        if self.timings_format == 'csv':
+            self.writer.writerow([
+                result['input_path'], ";".join(result['outputs']), result['ok'], result['worker'],
+                result['bytes_read'], result['bytes_written'], f"{result['latency']:.6f}",
+                *(f"{timings[stage]:.6f}" if stage in timings else '' for stage in STAGES)
+            ])
+        else:
+            row = {key: result[key] for key in ('input_path', 'outputs', 'ok', 'worker', 'bytes_read', 'bytes_written', 'latency', 'timings')}
+            self.file.write((",\n" if self.rows else "") + json.dumps(row))
+        self.rows += 1
+
+    def close(self):
+        if self.timings_format == 'json':
+            self.file.write("\n]\n")
+        self.file.close()
+
+
+def resolve_profiles(settings):
+    """
+    Returns the stamp profiles of a run as complete settings dicts: each entry
+    of settings['profiles'] merged over the top-level settings, writing to
+    the subdirectory named by its 'subdir' (default: its name). Without
+    profiles, the top-level settings are the only profile and write to the
+    output directory itself. Raises ValueError for unknown profile settings
+    and for subdirectories that leave the output directory or overlap
+    another profile's (one would overwrite the other's outputs).
+    """
+    base = {key: value for key, value in settings.items() if key != 'profiles'}
+    if not settings['profiles']:
+        return [{**base, 'name': 'default', 'subdir': ''}]
+
+    profiles = []
+    for index, overrides in enumerate(settings['profiles']):
+        unknown = set(overrides) - set(PROFILE_SETTINGS)
+        if unknown:
+            raise ValueError(f"Unknown setting(s) in profile {index + 1}: {', '.join(sorted(unknown))}")
+        name = overrides.get('name') or f"profile{index + 1}"
+        profiles.append({**base, 'subdir': name, **overrides, 'name': name})
+
+    output_dirs = {}
+    for profile in profiles:
+        subdir = profile['subdir']
+        if os.path.isabs(subdir) or os.path.splitdrive(subdir)[0] or '..' in subdir.replace('\\', '/').split('/'):
+            raise ValueError(f"Profile '{profile['name']}' must write inside the output directory, not to '{subdir}'")
+        # Compare normalized paths ('' becomes '.', the output directory itself)
+        output_dir = os.path.normcase(os.path.normpath(subdir))
+        for other_dir, other_name in output_dirs.items():
+            if output_dir == other_dir or '.' in (output_dir, other_dir) or output_dir.startswith(other_dir + os.sep) or other_dir.startswith(output_dir + os.sep):
+                raise ValueError(f"Profiles '{other_name}' and '{profile['name']}' write to overlapping subdirectories")
+        output_dirs[output_dir] = profile['name']
+    return profiles
+
+
+def load_logo_caches(profiles):
+    """
+    Returns a LogoCache for each distinct logo used by the profiles, keyed by
+    logo_path. Under a memory budget each cache keeps a single tile pattern.
+    """
+    max_tiles = 1 if profiles and profiles[0]['memory_budget_mb'] else TILE_CACHE_SIZE
+    logo_caches = {}
+    for profile in profiles:
+        if profile['logo_path'] not in logo_caches:
+            logo_caches[profile['logo_path']] = LogoCache(Image.open(profile['logo_path']).convert("RGBA"), max_tiles=max_tiles)
+    return logo_caches
+
+
+def cache_stats(logo_caches):
+    """
+    Returns the (hits, misses) totals of several logo caches.
+    """
+    stats = [logo_cache.stats() for logo_cache in logo_caches.values()]
+    return sum(hits for hits, _ in stats), sum(misses for _, misses in stats)
+
+
+def logo_position(position, frame_size, logo_size, margin=10, offset_x=0.0, offset_y=0.0):
+    """
+    Returns the (x, y) of the logo's top-left corner in the frame: placed by
+    position with margin pixels from the edges, then moved by offset_x /
+    offset_y percent of the frame's width / height.
+    """
+    frame_width, frame_height = frame_size
+    logo_width, logo_height = logo_size
+    if position == 'bottom-right':
+        pos = (frame_width - logo_width - margin, frame_height - logo_height - margin)
+    elif position == 'bottom-left':
+        pos = (margin, frame_height - logo_height - margin)
+    elif position == 'top-right':
+        pos = (frame_width - logo_width - margin, margin)
+    elif position == 'top-left':
+        pos = (margin, margin)
+    elif position == 'center':
+        pos = ((frame_width - logo_width) // 2, (frame_height - logo_height) // 2)
+    else:
+        raise ValueError("Invalid position argument")
+    return pos[0] + round(frame_width * offset_x / 100), pos[1] + round(frame_height * offset_y / 100)
+
+
+def composite_logo(frame, prepared, pos):
+    """
+    Blends a prepared logo (see LogoCache) into frame in place. Only the
+    logo's bounding box is touched; the rest of the frame is never copied.
+    """
+    logo_rgb, logo_mask, logo_rgba = prepared
+    x, y = pos
+    # Part of the frame covered by the logo; margins and offsets may push the
+    # logo partly or entirely outside the frame
+    left, top = max(0, x), max(0, y)
+    right, bottom = min(frame.width, x + logo_rgba.width), min(frame.height, y + logo_rgba.height)
+    if right <= left or bottom <= top:
+        return
+    if frame.mode == 'RGBA':
+        # Composite over the existing alpha so transparent areas stay correct.
+        # alpha_composite needs the part of the logo inside the frame.
+        source = (left - x, top - y, right - x, bottom - y)
+        frame.alpha_composite(logo_rgba, dest=(left, top), source=source)
+    else:
+        frame.paste(logo_rgb, pos, logo_mask)
+
+
+def draft_for_profiles(image, profiles):
+    """
+    Lets the JPEG decoder scale down in the DCT domain (1/2, 1/4, 1/8) while
+    decoding, to the largest size any profile needs. draft() never goes below
+    the requested size and is a no-op for other formats. On an image that has
+    not been loaded yet, image.size is updated without decoding anything.
+    """
+    max_dimensions = [profile['max_dimension'] for profile in profiles]
+    max_dimension = max(max_dimensions) if all(max_dimensions) else 0
+    if max_dimension and max(image.size) > max_dimension:
+        scale = max_dimension / max(image.size)
+        image.draft("RGB", (math.ceil(image.width * scale), math.ceil(image.height * scale)))
+
+
+def estimate_memory(input_path, profiles):
+    """
+    Estimates the peak memory in bytes needed to stamp an image, from its
+    header alone: the decoded frame, a converted copy for sources that are
+    not RGB or RGBA, a copy per additional profile, the encoded outputs, the
+    raw file (held in memory by the pipeline backend) and, for tile
+    profiles, the frame-sized RGBA tile pattern rendered for it.
+
+    Returns (bytes, largest tile pattern in bytes). Patterns stay cached
+    after the image is done; that resident memory is not part of the first
+    value (see StampEngine.resident_tile_memory).
+    """
+    with Image.open(input_path) as image:
+        draft_for_profiles(image, profiles)
+        width, height = image.size
+        frames = len(profiles) + (image.mode not in ('RGB', 'RGBA'))
+    pixels = width * height
+    tile_pixels = []
+    for profile in profiles:
+        if profile['position'] == 'tile':
+            # Patterns match the frame after the profile's downscale
+            max_dimension = profile['max_dimension']
+            scale = min(1.0, max_dimension / max(width, height)) if max_dimension else 1.0
+            tile_pixels.append(round(width * scale) * round(height * scale))
+    # Encoded outputs are budgeted at a byte per pixel, enough for high-quality JPEGs
+    memory = (
+        pixels * (frames * FRAME_BYTES_PER_PIXEL + len(profiles))
+        + sum(tile_pixels) * FRAME_BYTES_PER_PIXEL
+        + os.path.getsize(input_path)
+    )
+    return memory, max(tile_pixels, default=0) * FRAME_BYTES_PER_PIXEL
+
+
+def render_image(source, filename, logo_caches, profiles, timer):
+    """
+    Decodes an image from source (a path or binary file object) once, then
+    for every profile (see resolve_profiles) adds the logo and encodes it in
+    the profile's output format. logo_caches maps each profile's logo_path to
+    its LogoCache. Stage times are recorded with timer (a StageTimer).
+    Returns a list of (output_filename, encoded) in profile order, where
+    encoded is an io.BytesIO. Raises on failure.
+    """
+    with Image.open(source) as base_image:
+        outputs = [encoders.resolve_output(profile['output_format'], base_image.format, filename) for profile in profiles]
+        timer.lap('open')
+
+        # Decode at the largest size any profile needs
+        draft_for_profiles(base_image, profiles)
+
+        # Composite in RGB, or RGBA when the output format keeps transparency.
+        # Sources already in that mode (most photos) are used as decoded;
+        # anything else is converted once. If any profile keeps transparency
+        # the frame is decoded in RGBA and the others convert their copy.
+        modes = [encoders.target_mode(pil_format, base_image) for pil_format, _ in outputs]
+        mode = 'RGBA' if 'RGBA' in modes else 'RGB'
+        source_mode = base_image.mode
+        base_image.load()
+        if base_image.mode != mode:
+            base_image = base_image.convert(mode)
+        timer.lap('decode')
+
+        # Apply EXIF transpose to correct orientation. Done in place so images
+        # without an orientation tag are not copied. This also clears the
+        # orientation tag in the EXIF data passed through below.
+        ImageOps.exif_transpose(base_image, in_place=True)
+        icc_profile = base_image.info.get('icc_profile')
+        exif = base_image.info.get('exif')
+        if source_mode == 'CMYK':
+            # The embedded profile describes CMYK data, not the converted pixels
+            icc_profile = None
+        timer.lap('exif_transpose')
+
+        rendered = []
+        for index, profile in enumerate(profiles):
+            pil_format, output_filename = outputs[index]
+            frame = base_image
+            if frame.mode != modes[index]:
+                frame = frame.convert(modes[index])
+            elif index < len(profiles) - 1:
+                # Stamping is done in place, so every profile but the last
+                # works on its own copy of the decoded frame
+                frame = frame.copy()
+            encoded = stamp_frame(frame, pil_format, logo_caches[profile['logo_path']], profile, timer, icc_profile, exif)
+            rendered.append((output_filename, encoded))
+
+    return rendered
+
+
+def stamp_frame(frame, pil_format, logo_cache, settings, timer, icc_profile=None, exif=None):
+    """
+    Downscales a decoded frame to max_dimension if set, adds the logo in
+    place and encodes it. Returns the encoded io.BytesIO.
+    """
+    logo_size_ratio = settings['logo_size_ratio']
+    opacity = settings['opacity']
+    max_dimension = settings['max_dimension']
+
+    # Finish the downscale exactly; after a draft decode this is a small resize
+    if max_dimension and max(frame.size) > max_dimension:
+        frame.thumbnail((max_dimension, max_dimension), Image.Resampling.LANCZOS)
+    base_width, base_height = frame.size
+    timer.lap('resize')
+
+    # Calculate logo size
+    logo = logo_cache.logo
+    logo_size = int(min(base_width, base_height) * logo_size_ratio)
+    logo_ratio = logo.width / logo.height
+    logo_new_size = (logo_size, int(logo_size / logo_ratio))
+    if settings['position'] == 'tile':
+        # The whole pattern is rendered once per frame size and blended in one go
+        prepared = logo_cache.get_tile(frame.size, logo_new_size, opacity, settings['tile_angle'], settings['tile_spacing'])
+        pos = (0, 0)
+    else:
+        prepared = logo_cache.get(logo_new_size, opacity)
+        pos = logo_position(
+            settings['position'], frame.size, prepared[0].size,
+            settings['margin'], settings['offset_x'], settings['offset_y']
+        )
+    timer.lap('logo')
+
+    # Blend the logo into its bounding box in place
+    composite_logo(frame, prepared, pos)
+    timer.lap('composite')
+
+    # Encode to memory first so encode and write time are measured separately
+    encoded = io.BytesIO()
+    encoders.save_image(frame, encoded, pil_format, settings, icc_profile, exif)
+    timer.lap('encode')
+    return encoded
+
+
+def write_output(output_dir, output_filename, encoded):
+    """
+    Writes encoded output bytes atomically: to a temporary file that replaces
+    the output once complete. Returns the number of bytes written.
+    """
+    output_path = os.path.join(output_dir, output_filename)
+    # Unique per writer, in case two sources map to the same output name
+    partial_path = f"{output_path}.{os.getpid()}-{threading.get_ident()}{PARTIAL_SUFFIX}"
+    try:
+        with open(partial_path, 'wb') as output_file:
+            output_file.write(encoded.getbuffer())
+        os.replace(partial_path, output_path)
+    except BaseException:
+        try:
+            os.remove(partial_path)
+        except OSError:
+            pass
+        raise
+    return encoded.tell()
+
+
+def link_or_copy(source_path, output_path):
+    """
+    Makes output_path a hardlink to source_path, or a copy where hardlinks
+    are unavailable (e.g. FAT drives or across filesystems). Like
+    write_output, the output only appears once complete. Later runs replace
+    outputs rather than writing into them, so linked outputs never change
+    together.
+    """
+    partial_path = f"{output_path}.{os.getpid()}-{threading.get_ident()}{PARTIAL_SUFFIX}"
+    try:
+        try:
+            os.link(source_path, partial_path)
+        except OSError:
+            shutil.copyfile(source_path, partial_path)
+        os.replace(partial_path, output_path)
+    except BaseException:
+        try:
+            os.remove(partial_path)
+        except OSError:
+            pass
+        raise
+
+
+def remove_partial_outputs(directory):
+    """
+    Deletes outputs left half-written in directory, e.g. by a terminated worker.
+    """
+    with os.scandir(directory) as entries:
+        for entry in entries:
+            if entry.name.endswith(PARTIAL_SUFFIX):
+                try:
+                    os.remove(entry.path)
+                except OSError:
+                    pass
+
+
+def write_outputs(rendered, profiles, relative_dir):
+    """
+    Writes each profile's rendered output (see render_image) to its
+    subdirectory of the output directory, mirroring relative_dir.
+    Returns (outputs, bytes_written), outputs being the written paths
+    relative to the output directory.
+    """
+    outputs = []
+    bytes_written = 0
+    for profile, (output_filename, encoded) in zip(profiles, rendered):
+        output_dir = os.path.join(profile['output_dir'], profile['subdir'], relative_dir)
+        bytes_written += write_output(output_dir, output_filename, encoded)
+        outputs.append(os.path.join(profile['subdir'], relative_dir, output_filename))
+    return outputs, bytes_written
+
+
+def stamp_image(input_path, relative_dir, logo_caches, profiles, timings=None):
+    """
+    Adds the logo to a single image for every profile and saves the outputs
+    (see render_image and write_outputs). If a timings dict is given, seconds
+    spent per stage (see STAGES) are added to it.
+    Returns (outputs, bytes_read, bytes_written). Raises on failure.
+    """
+    timer = StageTimer({} if timings is None else timings)
+    with open(input_path, 'rb') as input_file:
+        bytes_read = os.fstat(input_file.fileno()).st_size
+        rendered = render_image(input_file, os.path.basename(input_path), logo_caches, profiles, timer)
+
+    outputs, bytes_written = write_outputs(rendered, profiles, relative_dir)
+    timer.lap('write')
+
+    return outputs, bytes_read, bytes_written
+
+
+def image_result(input_path, emit, outputs=None, bytes_read=0, bytes_written=0, error=None):
+    """
+    Reports a finished image through emit(kind, value) (a log line and a
+    progress step) and returns the start of its result dict.
+    """
+    filename = os.path.basename(input_path)
+    if error is None:
+        saved_as = ", ".join(f"'{output}'" for output in outputs)
+        emit('log', f"✅ Added logo to '{filename}' and saved as {saved_as}.")
+        result = {'ok': True, 'input_path': input_path, 'outputs': outputs, 'bytes_read': bytes_read, 'bytes_written': bytes_written}
+    else:
+        emit('log', f"❌ Failed to process '{filename}': {error}")
+        result = {'ok': False, 'input_path': input_path, 'outputs': [], 'bytes_read': 0, 'bytes_written': 0}
+    emit('progress', ('step', 1))
+    return result
+
+
+def process_single_image(input_path, relative_dir, logo_caches, profiles, emit):
+    """
+    Stamps one image, reporting a log line and a progress step through
+    emit(kind, value). Never raises; returns a result dict for the run summary
+    including the per-stage timings and total latency in seconds.
+    """
+    timings = {}
+    start_time = time.perf_counter()
+    try:
+        outputs, bytes_read, bytes_written = stamp_image(input_path, relative_dir, logo_caches, profiles, timings)
+        result = image_result(input_path, emit, outputs, bytes_read, bytes_written)
+    except Exception as e:
+        result = image_result(input_path, emit, error=e)
+    result['timings'] = timings
+    result['latency'] = time.perf_counter() - start_time
+    result['worker'] = threading.current_thread().name
+    return result
+
+
+# ===== Process Pool Workers =====
+# Per-process state, set up once by the pool initializer so the logos and
+# settings are not pickled and sent along with every task.
+_worker_logo_caches = None
+_worker_profiles = None
+_worker_events = None
+
+
+def init_process_worker(settings, event_queue):
+    """
+    Initializer for each worker process: loads the logos once and keeps the
+    profiles and the IPC queue used to send progress and log events back to
+    the parent.
+    """
+    global _worker_logo_caches, _worker_profiles, _worker_events
+    # Ctrl+C in a terminal reaches the whole process group; the parent decides
+    # how to cancel, so workers ignore it
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    _worker_profiles = resolve_profiles(settings)
+    _worker_logo_caches = load_logo_caches(_worker_profiles)
+    _worker_events = event_queue
+
+
+def warm_up_worker():
+    """
+    Does nothing; submitted to start a worker process (and run its
+    initializer) before a run's clock starts.
+    """
+    return os.getpid()
+
+
+def process_image_in_worker(input_path, relative_dir):
+    """
+    Task run inside a worker process. The task's events are sent over the IPC
+    queue as one batch, and the worker's pid and logo cache counters are added
+    to the result so the parent can total them.
+    """
+    events = []
+    result = process_single_image(
+        input_path, relative_dir, _worker_logo_caches, _worker_profiles, lambda kind, value: events.append((kind, value))
+    )
+    _worker_events.put(events)
+    result['pid'] = os.getpid()
+    result['worker'] = f"pid {result['pid']}"
+    result['cache_stats'] = cache_stats(_worker_logo_caches)
+    return result
+
+
+# ===== Pipeline Backend =====
+class PipelineExecutor:
+    """
+    Executor-like staged pipeline for slow (e.g. network) storage. Reader
+    threads prefetch raw file bytes, max_workers decode threads decode from
+    memory, composite and encode, and writer threads write the encoded bytes
+    out. Bounded queues between the stages give backpressure, so the decode
+    threads stay busy while reads and writes wait on I/O without the number
+    of buffered files growing.
+
+    submit(input_path, relative_dir) returns a Future resolving to the same
+    result dict as process_single_image.
+    """
+
+    def __init__(self, max_workers, logo_caches, profiles, emit):
+        self.logo_caches = logo_caches
+        self.profiles = profiles
+        self.emit = emit
+        # Set by shutdown(cancel_futures=True): images waiting between stages are dropped
+        self.dropping = False
+        self.read_queue = queue.Queue()
+        self.decode_queue = queue.Queue(maxsize=max_workers * PIPELINE_BUFFERED_PER_WORKER)
+        self.write_queue = queue.Queue(maxsize=max_workers * PIPELINE_BUFFERED_PER_WORKER)
+        self.stages = [
+            (self.read_queue, self.start_threads('read', PIPELINE_READERS, self.read_stage)),
+            (self.decode_queue, self.start_threads('decode', max_workers, self.decode_stage)),
+            (self.write_queue, self.start_threads('write', PIPELINE_WRITERS, self.write_stage))
+        ]
+
+    def start_threads(self, name, count, target):
+        threads = [threading.Thread(target=target, name=f"pipeline-{name}-{index}", daemon=True) for index in range(count)]
+        for thread in threads:
+            thread.start()
+        return threads
+
+    def submit(self, input_path, relative_dir):
+        future = Future()
+        job = {'future': future, 'input_path': input_path, 'relative_dir': relative_dir, 'timings': {}, 'worker': None}
+        self.read_queue.put(job)
+        return future
+
+    def shutdown(self, wait=True, cancel_futures=False):
+        """
+        Lets every submitted image finish, then stops the stages in order.
+        With cancel_futures, images not yet read are cancelled and those
+        waiting between stages are dropped, so each thread only finishes the
+        image it is working on. With wait=False, returns without waiting for
+        the stages to stop.
+        """
+        if cancel_futures:
+            self.dropping = True
+            while True:
+                try:
+                    job = self.read_queue.get_nowait()
+                except queue.Empty:
+                    break
+                job['future'].cancel()
+        if wait:
+            self.stop_stages()
+        else:
+            threading.Thread(target=self.stop_stages, daemon=True).start()
+
+    def stop_stages(self):
+        for stage_queue, threads in self.stages:
+            for _ in threads:
+                stage_queue.put(None)
+            for thread in threads:
+                thread.join()
+
+    def drop(self, job):
+        job.pop('data', None)
+        job.pop('rendered', None)
+        job['future'].set_exception(CancelledError())
+
+    def finish(self, job, **outcome):
+        result = image_result(job['input_path'], self.emit, **outcome)
+        result['timings'] = job['timings']
+        result['latency'] = time.perf_counter() - job['start_time']
+        result['worker'] = job['worker'] or threading.current_thread().name
+        job['future'].set_result(result)
+
+    def read_stage(self):
+        while True:
+            job = self.read_queue.get()
+            if job is None:
+                break
+            if not job['future'].set_running_or_notify_cancel():
+                continue
+            job['start_time'] = time.perf_counter()
+            try:
+                with open(job['input_path'], 'rb') as input_file:
+                    job['data'] = input_file.read()
+            except Exception as e:
+                self.finish(job, error=e)
+                continue
+            job['timings']['read'] = time.perf_counter() - job['start_time']
+            self.decode_queue.put(job)
+
+    def decode_stage(self):
+        while True:
+            job = self.decode_queue.get()
+            if job is None:
+                break
+            if self.dropping:
+                self.drop(job)
+                continue
+            job['worker'] = threading.current_thread().name
+            data = job.pop('data')
+            job['bytes_read'] = len(data)
+            try:
+                timer = StageTimer(job['timings'])
+                filename = os.path.basename(job['input_path'])
+                job['rendered'] = render_image(io.BytesIO(data), filename, self.logo_caches, self.profiles, timer)
+            except Exception as e:
+                self.finish(job, error=e)
+                continue
+            finally:
+                # Drop the raw bytes before waiting on the writers
+                del data
+            self.write_queue.put(job)
+
+    def write_stage(self):
+        while True:
+            job = self.write_queue.get()
+            if job is None:
+                break
+            if self.dropping:
+                self.drop(job)
+                continue
+            try:
+                timer = StageTimer(job['timings'])
+                outputs, bytes_written = write_outputs(job.pop('rendered'), self.profiles, job['relative_dir'])
+                timer.lap('write')
+            except Exception as e:
+                self.finish(job, error=e)
+                continue
+            self.finish(job, outputs=outputs, bytes_read=job['bytes_read'], bytes_written=bytes_written)
+
+
+def terminate_workers(executor):
+    """
+    Kills a process pool's workers, for cancelled runs whose images did not
+    finish in time. Must be called before the executor is shut down.
+    """
+    if hasattr(executor, 'terminate_workers'):  # Python 3.14+
+        executor.terminate_workers()
+        return
+    for process in list((executor._processes or {}).values()):
+        process.terminate()
+
+
+class StampEngine:
+    """
+    Runs a stamping batch described by a settings dict (the settings.json schema).
+
+    log(message) receives log lines and progress(event) receives ('step', n)
+    tuples, plus ('set_max', total) once the directory scan has finished. The
+    scan streams alongside processing, so steps arrive before the total is
+    known. ('stats', snapshot) events with live throughput figures (see
+    RunStats.snapshot) arrive every STATS_INTERVAL seconds. Both callbacks may
+    be called from worker threads, so GUI callers
+    should hand them to a queue. on_result(result), if given, receives each
+    image's result dict (see process_single_image) on the thread calling run().
+
+    cancel() may be called from any thread to stop a run early: images not yet
+    started are cancelled and running ones get cancel_timeout seconds to
+    finish before process workers are terminated (thread workers cannot be
+    interrupted and finish in the background).
+
+    With warm_up, every worker process is started before the run's clock
+    starts, so the summary's elapsed time and throughput leave out
+    interpreter start-up (for benchmarks).
+    """
+
+    def __init__(self, settings, log=None, progress=None, on_result=None, warm_up=False):
+        self.settings = {**DEFAULT_SETTINGS, **settings}
+        self.log = log or (lambda message: None)
+        self.progress = progress or (lambda event: None)
+        self.on_result = on_result
+        self.warm_up = warm_up
+        self.max_workers = self.settings['max_workers'] or default_max_workers()
+        self.cancel_event = threading.Event()
+
+    def cancel(self):
+        """
+        Asks a running batch to stop. Thread-safe; run() returns shortly after.
+        """
+        self.cancel_event.set()
+
+    @property
+    def cancelled(self):
+        return self.cancel_event.is_set()
+
+    def emit(self, kind, value):
+        if kind == 'log':
+            self.log(value)
+        elif kind == 'progress':
+            self.progress(value)
+
+    def run(self):
+        """
+        Processes every supported image in the input directory.
+        Returns a summary dict, or None if the run could not start.
+        """
+        input_dir = self.settings['input_dir']
+        output_dir = self.settings['output_dir']
+        backend = self.settings['backend']
+
+        if backend not in BACKENDS:
+            self.log(f"Unknown backend '{backend}'. Choose one of: {', '.join(BACKENDS)}.")
+            return None
+
+        export_timings = self.settings['export_timings']
+        if export_timings and export_timings not in TIMINGS_FORMATS:
+            self.log(f"Unknown timings export format '{export_timings}'. Choose one of: {', '.join(TIMINGS_FORMATS)}.")
+            return None
+
+        try:
+            profiles = resolve_profiles(self.settings)
+        except (ValueError, TypeError, AttributeError) as e:
+            self.log(f"Error in stamp profiles: {e}")
+            return None
+
+        for profile in profiles:
+            output_format = profile['output_format']
+            if output_format not in encoders.available_formats():
+                self.log(f"Output format '{output_format}' is not available. Choose one of: {', '.join(encoders.available_formats())}.")
+                return None
+
+        # Ensure output directory exists
+        try:
+            os.makedirs(output_dir, exist_ok=True)
+            self.log(f"Output directory ensured at: {output_dir}")
+        except Exception as e:
+            self.log(f"Error ensuring output directory: {e}")
+            return None
+
+        # Load the logo images
+        try:
+            logo_caches = load_logo_caches(profiles)
+            for logo_path in logo_caches:
+                self.log(f"Loaded logo from: {logo_path}")
+        except Exception as e:
+            self.log(f"Error loading logo: {e}")
+            return None
+
+        if not os.path.isdir(input_dir):
+            self.log(f"Error accessing input directory: '{input_dir}' is not a directory.")
+            return None
+
+        self.log(f"Using {backend} backend with {self.max_workers} worker(s).")
+        if self.settings['memory_budget_mb']:
+            self.log(f"Memory budget: {self.settings['memory_budget_mb']} MB for the images being processed at once.")
+        if self.settings['profiles']:
+            self.log(f"Stamping {len(profiles)} profile(s): {', '.join(profile['name'] for profile in profiles)}.")
+        self.profiles = profiles
+
+        self.summary = {
+            'total': 0,
+            'processed': 0,
+            'skipped': 0,
+            'failed': 0,
+            'cancelled': 0,
+            'deduplicated': 0,
+            'aborted': False,
+            'stopped': False,
+            'bytes_read': 0,
+            'bytes_written': 0,
+            'elapsed': 0.0,
+            'cache_hits': 0,
+            'cache_misses': 0
+        }
+        # Logo cache counters, per worker process (thread workers share one cache)
+        self.worker_cache_stats = {}
+        start_time = time.perf_counter()
+        self.stats = RunStats()
+        self.last_stats_time = 0.0
+        self.scan_complete = False
+        self.created_dirs = set()
+        self.output_dir = output_dir
+
+        # Admission control: estimated memory of each running task, and the total
+        self.task_memory = {}
+        self.memory_in_flight = 0
+        self.exclusive_count = 0
+        self.largest_tile_pattern = 0
+
+        # Dedup runs stamp each distinct content once. Duplicates found before
+        # their original has finished wait for its outputs.
+        self.duplicates = DuplicateIndex() if self.settings['dedup'] else None
+        self.waiting_duplicates = {}
+        self.finished_outputs = {}
+
+        # Incremental runs skip sources already recorded with the same inputs
+        self.manifest = None
+        self.pending_entries = {}
+        if self.settings['incremental']:
+            try:
+                self.manifest = Manifest(output_dir)
+                self.manifest.load()
+                # Profiles only count when set, so runs without them keep matching older manifests
+                self.settings_hash = hash_settings(self.settings, OUTPUT_SETTINGS + (['profiles'] if self.settings['profiles'] else []))
+                logo_hashes = {logo_path: hash_file(logo_path) for logo_path in logo_caches}
+                self.logo_hash = next(iter(logo_hashes.values())) if len(logo_hashes) == 1 else hash_settings(logo_hashes, logo_hashes)
+                self.log(f"Incremental mode: {len(self.manifest.entries)} image(s) in the manifest.")
+            except Exception as e:
+                self.log(f"Error reading manifest: {e}")
+                return None
+
+        # Opened last, so an early return above never truncates a previous export
+        self.timings_exporter = None
+        if export_timings:
+            timings_path = os.path.join(output_dir, f"{TIMINGS_FILENAME}.{export_timings}")
+            try:
+                self.timings_exporter = TimingsExporter(timings_path, export_timings)
+            except Exception as e:
+                self.log(f"Error creating timings export: {e}")
+                return None
+
+        if backend == 'process':
+            # Workers report back over an IPC queue; a forwarder thread feeds
+            # those events into the log and progress callbacks.
+            mp_context = multiprocessing.get_context('spawn')
+            event_queue = mp_context.Queue()
+            forwarder_stop = threading.Event()
+            forwarder = threading.Thread(target=self.forward_worker_events, args=(event_queue, forwarder_stop), daemon=True)
+            forwarder.start()
+            executor = ProcessPoolExecutor(
+                max_workers=self.max_workers,
+                mp_context=mp_context,
+                initializer=init_process_worker,
+                initargs=(self.settings, event_queue)
+            )
+            submit = lambda input_path, relative_dir: executor.submit(
+                process_image_in_worker, input_path, relative_dir
+            )
+            if self.warm_up:
+                # Workers are started on demand, one per submission while none
+                # is idle; they take long enough to start that all of them are
+                wait([executor.submit(warm_up_worker) for _ in range(self.max_workers)])
+                start_time = time.perf_counter()
+                self.stats = RunStats()
+        elif backend == 'pipeline':
+            executor = PipelineExecutor(self.max_workers, logo_caches, profiles, self.emit)
+            submit = executor.submit
+        else:
+            executor = ThreadPoolExecutor(max_workers=self.max_workers)
+            submit = lambda input_path, relative_dir: executor.submit(
+                process_single_image, input_path, relative_dir, logo_caches, profiles, self.emit
+            )
+
+        unfinished = set()
+        try:
+            unfinished = self.run_tasks(submit, self.iter_tasks(input_dir, output_dir))
+        finally:
+            # Shutdown the executor
+            if self.cancelled:
+                if unfinished and backend == 'process':
+                    self.log(f"Terminating {len(unfinished)} image(s) still running after {self.settings['cancel_timeout']}s.")
+                    terminate_workers(executor)
+                elif unfinished and backend == 'pipeline':
+                    self.log(f"Dropping {len(unfinished)} image(s) still running after {self.settings['cancel_timeout']}s once their current stage finishes.")
+                elif unfinished:
+                    self.log(f"{len(unfinished)} image(s) still running after {self.settings['cancel_timeout']}s will finish in the background.")
+                # Pipeline threads are daemons, so wait for them rather than
+                # let the interpreter kill them in the middle of a write
+                executor.shutdown(wait=backend == 'pipeline', cancel_futures=True)
+            else:
+                executor.shutdown(wait=True)
+            if backend == 'process':
+                forwarder_stop.set()
+                forwarder.join()
+                if unfinished:
+                    for profile in profiles:
+                        for relative_dir in self.created_dirs:
+                            remove_partial_outputs(os.path.join(output_dir, profile['subdir'], relative_dir))
+            else:
+                self.worker_cache_stats[os.getpid()] = cache_stats(logo_caches)
+            if self.manifest is not None:
+                self.manifest.close()
+            if self.timings_exporter is not None:
+                self.timings_exporter.close()
+                self.log(f"Per-image timings written to {self.timings_exporter.file.name}")
+
+        # Duplicates of images that were cancelled, or lost with a crashed worker
+        waiting = sum(len(duplicates) for duplicates in self.waiting_duplicates.values())
+        self.summary['cancelled' if self.cancelled else 'failed'] += waiting
+
+        if self.summary['skipped']:
+            self.log(f"Skipped {self.summary['skipped']} unchanged image(s).")
+        if self.exclusive_count:
+            self.log(f"Processed {self.exclusive_count} image(s) over the memory budget one at a time.")
+        if self.summary['deduplicated']:
+            self.log(f"Linked {self.summary['deduplicated']} duplicate image(s) instead of stamping them again.")
+        # A cancel that arrives once all the work is done doesn't stop anything
+        self.summary['stopped'] = self.cancelled and (not self.scan_complete or self.summary['cancelled'] > 0)
+        if self.summary['stopped'] and not self.scan_complete:
+            not_processed = f"{self.summary['cancelled']} image(s) found so far not processed, " if self.summary['cancelled'] else ""
+            self.log(f"Run cancelled during the scan: {not_processed}the rest of the input directory was not scanned.")
+        elif self.summary['stopped']:
+            self.log(f"Run cancelled: {self.summary['cancelled']} image(s) not processed.")
+
+        if self.summary['total'] == 0 and not (self.summary['aborted'] or self.summary['stopped']):
+            self.log("No supported images found in the input directory.")
+            return None
+
+        self.summary['elapsed'] = time.perf_counter() - start_time
+        self.summary['cache_hits'] = sum(hits for hits, _ in self.worker_cache_stats.values())
+        self.summary['cache_misses'] = sum(misses for _, misses in self.worker_cache_stats.values())
+        self.log(f"Logo cache: {self.summary['cache_hits']} hit(s), {self.summary['cache_misses']} miss(es).")
+        self.log_stage_summary()
+        return self.summary
+
+    def log_stage_summary(self):
+        """
+        Logs where the time went, overall and per worker.
+        """
+        stage_totals = self.stats.stage_totals
+        total = sum(stage_totals.values())
+        if not total:
+            return
+        shares = ", ".join(f"{stage} {stage_totals[stage] / total:.0%}" for stage in STAGES if stage in stage_totals)
+        self.log(f"Time per stage: {shares}")
+        for name, worker in sorted(self.stats.workers.items()):
+            slowest_stage, slowest_share = self.stats.slowest_stage(worker['stages'])
+            self.log(
+                f"  {name}: {worker['images']} image(s), {worker['busy']:.2f}s busy, "
+                f"slowest stage {slowest_stage} ({slowest_share:.0%})"
+            )
+
+    def iter_tasks(self, input_dir, output_dir):
+        """
+        Yields (input_path, relative_dir) pairs as the input directory is
+        scanned, mirroring subdirectories into each profile's output tree.
+        Reports the total once the scan is complete. Stops scanning when the
+        run is cancelled, including while sources are being skipped, linked
+        or hashed without yielding anything.
+        """
+        recursive = self.settings['recursive']
+        on_error = lambda path, e: self.log(f"❌ Skipping unreadable directory '{path}': {e}")
+
+        for relative_path in scan_images(input_dir, recursive, exclude_dir=output_dir, on_error=on_error):
+            if self.cancelled:
+                return
+            relative_dir = os.path.dirname(relative_path)
+            self.summary['total'] += 1
+            input_path = os.path.join(input_dir, relative_path)
+            if relative_dir not in self.created_dirs:
+                try:
+                    for profile in self.profiles:
+                        os.makedirs(os.path.join(output_dir, profile['subdir'], relative_dir), exist_ok=True)
+                except OSError as e:
+                    self.fail_task(input_path, f"can't create the output directory: {e}")
+                    continue
+                self.created_dirs.add(relative_dir)
+
+            if self.manifest is not None:
+                try:
+                    entry = self.manifest_entry(input_path, relative_path)
+                except OSError as e:
+                    # e.g. removed or still locked since the scan
+                    self.fail_task(input_path, e)
+                    continue
+                if self.manifest.is_current(entry):
+                    self.summary['skipped'] += 1
+                    self.progress(('step', 1))
+                    continue
+                self.pending_entries[input_path] = entry
+
+            if self.duplicates is not None:
+                content_hash = entry['content_hash'] if self.manifest is not None else None
+                try:
+                    original = self.duplicates.find(input_path, os.path.getsize(input_path), content_hash)
+                except OSError as e:
+                    self.fail_task(input_path, e)
+                    continue
+                if original is not None:
+                    if original in self.finished_outputs:
+                        self.link_duplicate(original, self.finished_outputs[original], input_path, relative_dir)
+                    else:
+                        self.waiting_duplicates.setdefault(original, []).append((input_path, relative_dir))
+                    continue
+
+            yield input_path, relative_dir
+
+        self.scan_complete = True
+        if self.summary['total']:
+            self.log(f"Found {self.summary['total']} supported image(s) in the input directory.")
+            self.progress(('set_max', self.summary['total']))
+
+    def fail_task(self, input_path, error):
+        """
+        Counts a source that failed before it could be submitted (e.g. it
+        vanished after the scan), without stopping the run.
+        """
+        self.pending_entries.pop(input_path, None)
+        self.log(f"❌ Failed to process '{os.path.basename(input_path)}': {error}")
+        self.summary['failed'] += 1
+        self.progress(('step', 1))
+
+    def link_duplicate(self, original, outputs, input_path, relative_dir):
+        """
+        Produces the outputs of a source identical to original by linking (or
+        copying) original's outputs, which are None if original failed.
+        """
+        filename = os.path.basename(input_path)
+        entry = self.pending_entries.pop(input_path, None)
+        try:
+            if outputs is None:
+                raise ValueError(f"identical to '{os.path.basename(original)}', which failed")
+            base_filename = os.path.splitext(filename)[0]
+            duplicate_outputs = []
+            for profile, output in zip(self.profiles, outputs):
+                duplicate_output = os.path.join(profile['subdir'], relative_dir, base_filename + os.path.splitext(output)[1])
+                link_or_copy(os.path.join(self.output_dir, output), os.path.join(self.output_dir, duplicate_output))
+                duplicate_outputs.append(duplicate_output)
+        except (OSError, ValueError) as e:
+            self.log(f"❌ Failed to process '{filename}': {e}")
+            self.summary['failed'] += 1
+        else:
+            linked_as = ", ".join(f"'{output}'" for output in duplicate_outputs)
+            self.log(f"🔗 '{filename}' is identical to '{os.path.basename(original)}'; linked as {linked_as}.")
+            self.summary['deduplicated'] += 1
+            if entry is not None:
+                entry['outputs'] = duplicate_outputs
+                self.manifest.record(entry)
+        self.progress(('step', 1))
+
+    def manifest_entry(self, input_path, relative_path):
+        """
+        Describes a source's current inputs for comparison with the manifest.
+        """
+        stat = os.stat(input_path)
+        return {
+            'source': relative_path,
+            'size': stat.st_size,
+            'mtime_ns': None if self.settings['incremental_content_hash'] else stat.st_mtime_ns,
+            'content_hash': hash_file(input_path) if self.settings['incremental_content_hash'] else None,
+            'settings_hash': self.settings_hash,
+            'logo_hash': self.logo_hash
+        }
+
+    def run_tasks(self, submit, tasks):
+        """
+        Submits tasks as they are produced, keeping only a bounded number of
+        futures in flight. Processing starts on the first task while the rest
+        are still being produced, and memory stays flat however many there are.
+        Stops early when the run is cancelled. Returns the futures still
+        running after a cancellation's grace period.
+
+        With a memory budget, each image's decoded size is estimated from its
+        header and images are only admitted while the running ones, plus the
+        tile patterns the logo caches keep between images, fit in the budget.
+        An image too large for the budget on its own waits for the
+        others to finish and then runs alone.
+
+        If the input directory becomes unreadable part-way through, the run
+        is marked as aborted; the tasks already submitted are still collected.
+        """
+        max_in_flight = self.max_workers * TASKS_PER_WORKER
+        budget = self.settings['memory_budget_mb'] * 1e6
+        in_flight = set()
+
+        try:
+            for task in tasks:
+                memory = self.estimate_task_memory(task[0]) if budget else 0
+                while in_flight and not self.cancelled and (
+                    len(in_flight) >= max_in_flight or (budget and self.memory_in_flight + self.resident_tile_memory() + memory > budget)
+                ):
+                    in_flight = self.wait_for_results(in_flight)
+                if self.cancelled:
+                    # This task was taken from the scan but won't be submitted
+                    self.summary['cancelled'] += 1
+                    return self.cancel_tasks(in_flight)
+                if budget and memory > budget:
+                    self.exclusive_count += 1
+                    self.log(f"Processing '{os.path.basename(task[0])}' on its own: about {memory / 1e6:.0f} MB decoded is over the memory budget.")
+                future = submit(*task)
+                self.task_memory[future] = memory
+                self.memory_in_flight += memory
+                in_flight.add(future)
+        except OSError as e:
+            self.log(f"❌ Error accessing input directory: {e}")
+            self.summary['aborted'] = True
+
+        while in_flight and not self.cancelled:
+            in_flight = self.wait_for_results(in_flight)
+        return self.cancel_tasks(in_flight)
+
+    def wait_for_results(self, in_flight):
+        """
+        Waits briefly for tasks to finish and collects them. Returns the
+        futures still in flight.
+        """
+        done, in_flight = wait(in_flight, timeout=CANCEL_POLL_INTERVAL, return_when=FIRST_COMPLETED)
+        for future in done:
+            self.memory_in_flight -= self.task_memory.pop(future, 0)
+        self.collect_results(done)
+        return in_flight
+
+    def estimate_task_memory(self, input_path):
+        """
+        Returns estimate_memory for a source, or 0 if its header can't be read
+        (the worker then reports the error). Tracks the largest tile pattern
+        seen for resident_tile_memory.
+        """
+        try:
+            memory, tile_pattern = estimate_memory(input_path, self.profiles)
+        except Exception:
+            return 0
+        self.largest_tile_pattern = max(self.largest_tile_pattern, tile_pattern)
+        return memory
+
+    def resident_tile_memory(self):
+        """
+        Upper bound on the tile patterns kept alive between images: under a
+        memory budget each logo cache keeps one pattern, no larger than the
+        largest estimated so far. Thread and pipeline workers share one cache
+        per logo; each worker process has its own.
+        """
+        tile_logos = {profile['logo_path'] for profile in self.profiles if profile['position'] == 'tile'}
+        holders = self.max_workers if self.settings['backend'] == 'process' else 1
+        return holders * len(tile_logos) * self.largest_tile_pattern
+
+    def cancel_tasks(self, in_flight):
+        """
+        Cancels the tasks that have not started and gives the running ones
+        cancel_timeout seconds to finish. Returns those still running.
+        """
+        if not in_flight:
+            return set()
+        started = {future for future in in_flight if not future.cancel()}
+        self.summary['cancelled'] += len(in_flight) - len(started)
+        done, not_done = wait(started, timeout=self.settings['cancel_timeout'])
+        self.collect_results(done)
+        self.summary['cancelled'] += len(not_done)
+        return not_done
+
+    def collect_results(self, futures):
+        for future in futures:
+            try:
+                result = future.result()  # This will re-raise any exception occurred in the worker
+            except Exception as e:
+                self.log(f"❌ Unexpected error: {e}")
+                self.summary['failed'] += 1
+                continue
+
+            entry = self.pending_entries.pop(result['input_path'], None)
+            if result['ok']:
+                self.summary['processed'] += 1
+                if entry is not None:
+                    entry['outputs'] = result['outputs']
+                    self.manifest.record(entry)
+            else:
+                self.summary['failed'] += 1
+            self.summary['bytes_read'] += result['bytes_read']
+            self.summary['bytes_written'] += result['bytes_written']
+            self.stats.add(result)
+            if self.timings_exporter is not None:
+                self.timings_exporter.add(result)
+            if self.on_result is not None:
+                self.on_result(result)
+
+            if self.duplicates is not None:
+                outputs = result['outputs'] if result['ok'] else None
+                self.finished_outputs[result['input_path']] = outputs
+                for duplicate in self.waiting_duplicates.pop(result['input_path'], []):
+                    self.link_duplicate(result['input_path'], outputs, *duplicate)
+
+            if 'cache_stats' in result:
+                # Counters only grow, but results can arrive out of order
+                hits, misses = result['cache_stats']
+                previous_hits, previous_misses = self.worker_cache_stats.get(result['pid'], (0, 0))
+                if hits + misses > previous_hits + previous_misses:
+                    self.worker_cache_stats[result['pid']] = (hits, misses)
+
+        self.report_stats()
+
+    def report_stats(self):
+        """
+        Sends a ('stats', snapshot) progress event, at most every STATS_INTERVAL seconds.
+        """
+        now = time.perf_counter()
+        if now - self.last_stats_time < STATS_INTERVAL:
+            return
+        self.last_stats_time = now
+        remaining = None
+        if self.scan_complete:
+            remaining = self.summary['total'] - sum(self.summary[key] for key in ('processed', 'failed', 'skipped', 'cancelled', 'deduplicated'))
+        self.progress(('stats', self.stats.snapshot(remaining)))
+
+    def forward_worker_events(self, event_queue, stop):
+        """
+        Relays batches of progress and log events from worker processes to the
+        callbacks. Stops once stop is set and the queue is empty. (A sentinel
+        can't be used: a terminated worker may still hold the queue's write lock.)
+        """
+        while True:
+            try:
+                events = event_queue.get(timeout=CANCEL_POLL_INTERVAL)
+            except queue.Empty:
+                if stop.is_set():
+                    break
+                continue
+            for kind, value in events:
+                self.emit(kind, value)
+
+
+def format_summary(summary):
+    """
+    Returns a one-line throughput summary for a finished run.
+    """
+    elapsed = max(summary['elapsed'], 1e-9)
+    done = summary['processed'] + summary['failed']
+    skipped = f"{summary['skipped']} skipped, " if summary.get('skipped') else ""
+    cancelled = f"{summary['cancelled']} cancelled, " if summary.get('cancelled') else ""
+    deduplicated = ""
+    if summary.get('deduplicated'):
+        ratio = summary['deduplicated'] / (summary['processed'] + summary['deduplicated'])
+        deduplicated = f"{summary['deduplicated']} deduplicated ({ratio:.0%}), "
+    return (
+        f"{summary['processed']} image(s) processed, {deduplicated}{skipped}{cancelled}{summary['failed']} failed in {summary['elapsed']:.2f}s "
+        f"({done / elapsed:.1f} images/s, "
+        f"{summary['bytes_read'] / elapsed / 1e6:.1f} MB/s read, "
+        f"{summary['bytes_written'] / elapsed / 1e6:.1f} MB/s written)"
+    )
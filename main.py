@@ -1,35 +1,59 @@
+import startup  # first, so cold-start timing covers the other imports
 import os
 import sys
-import json
 import threading
 import queue
-import appdirs
-from PIL import Image, ImageOps
+from collections import deque
 import tkinter as tk
 from tkinter import filedialog, messagebox, ttk
-from concurrent.futures import ThreadPoolExecutor, as_completed
-import multiprocessing
+import config
+
+# The processing stack (engine: Pillow, the worker pools) is imported on the
+# first run rather than here, so the window appears without waiting for it.
+
+# Lines kept in the on-screen log; older lines are dropped from the view but
+# remain in the log file.
+LOG_VIEW_LINES = 1000
+
+# Milliseconds between event queue polls, and the most events handled per poll
+# so a flood of events can't stall the window.
+EVENT_POLL_INTERVAL = 100
+MAX_EVENTS_PER_POLL = 20000
+
+# Full log of the most recent run, in the settings directory
+LOG_FILENAME = "last-run.log"
+
+# Milliseconds to wait after the last change before writing settings.json, so
+# dragging a slider writes the file once instead of on every tick
+SETTINGS_SAVE_DELAY = 500
+
+
+def is_error_line(message):
+    return message.startswith(("❌", "Error"))
+
 
 class ImageStamperGUI:
     def __init__(self, master):
         self.master = master
         master.title("Image Stamper - Batch Logo Adder")
-        master.geometry("800x600")
-        master.minsize(800, 600)
+        master.geometry("800x640")
+        master.minsize(800, 640)
         master.resizable(True, True)  # Allow window to be resizable
 
         # Configure grid to make the GUI responsive
         self.master.columnconfigure(0, weight=0)
         self.master.columnconfigure(1, weight=1)
         self.master.columnconfigure(2, weight=0)
-        self.master.rowconfigure(8, weight=1)  # Allow the Progress Log to expand
+        self.master.rowconfigure(14, weight=1)  # Allow the Progress Log to expand
 
-        # Determine the settings directory using appdirs
-        self.settings_dir = appdirs.user_config_dir("ImageStamper", "maplenetwork")
-        os.makedirs(self.settings_dir, exist_ok=True)
+        # Path to settings.json in the user's config directory
+        self.settings_path = config.get_settings_path()
 
-        # Path to settings.json
-        self.settings_path = os.path.join(self.settings_dir, "settings.json")
+        # Settings loaded from disk, including keys the GUI doesn't edit (e.g. max_workers)
+        self.settings = dict(config.DEFAULT_SETTINGS)
+
+        # Pending debounced settings write (a Tk after() id), if any
+        self.save_job = None
 
         # Initialize variables
         self.input_dir = tk.StringVar()
@@ -38,24 +62,49 @@ class ImageStamperGUI:
         self.position = tk.StringVar(value="bottom-right")
         self.logo_size_ratio = tk.DoubleVar(value=0.15)
         self.opacity = tk.IntVar(value=128)
+        self.max_dimension = tk.IntVar(value=0)
+        self.output_format = tk.StringVar(value="jpeg")
+        self.quality = tk.IntVar(value=100)
+        self.jpeg_subsampling = tk.StringVar(value='4:2:0')
+        self.jpeg_optimize = tk.BooleanVar(value=False)
+        self.jpeg_progressive = tk.BooleanVar(value=False)
+        self.webp_method = tk.IntVar(value=4)
+        self.webp_lossless = tk.BooleanVar(value=False)
+        self.avif_speed = tk.IntVar(value=6)
+        self.keep_icc_profile = tk.BooleanVar(value=True)
+        self.backend = tk.StringVar(value="thread")
+        self.recursive = tk.BooleanVar(value=False)
+        self.incremental = tk.BooleanVar(value=False)
+        self.dedup = tk.BooleanVar(value=False)
+        self.keep_exif = tk.BooleanVar(value=False)
+        self.export_timings = tk.StringVar(value='')
+
+        # Single queue of (kind, value) events from worker threads to the Tk main loop
+        self.event_queue = queue.Queue()
+
+        # Recent log lines for the on-screen view (all, and errors only), and
+        # the file the full log of a run is streamed to
+        self.log_lines = deque(maxlen=LOG_VIEW_LINES)
+        self.error_lines = deque(maxlen=LOG_VIEW_LINES)
+        self.errors_only = tk.BooleanVar(value=False)
+        self.log_file = None
+        self.log_file_path = os.path.join(os.path.dirname(self.settings_path), LOG_FILENAME)
 
-        # Initialize queues for thread-safe communication
-        self.log_queue = queue.Queue()
-        self.progress_queue = queue.Queue()
-        self.status_queue = queue.Queue()
-
-        # Initialize ThreadPoolExecutor
-        self.executor = None
-        
         # Determine optimal number of workers
-        cpu_count = (multiprocessing.cpu_count() or 1)
-        min_cores = 1
-        max_cores = 32
-        self.max_workers = max(min_cores, min(round(cpu_count - cpu_count / 4), max_cores))
+        self.max_workers = config.default_max_workers()
         print(f"Max workers: {self.max_workers}")
 
-        # Flag to control processing
+        # Flag to control processing, the running engine (for Stop), and
+        # whether to close the window once the run has stopped
         self.processing = False
+        self.stamp_engine = None
+        self.closing = False
+
+        # Images finished so far, whether the total is known yet, and the
+        # engine's latest live throughput figures
+        self.completed_count = 0
+        self.scan_complete = True
+        self.latest_stats = None
 
         # Flag to indicate if settings are being loaded
         self.loading_settings = False  # <--- Added Flag
@@ -66,10 +115,11 @@ class ImageStamperGUI:
         # Load settings if available
         self.load_settings()
 
-        # Start queue processors
-        self.master.after(100, self.process_log_queue)
-        self.master.after(100, self.update_progress)
-        self.master.after(100, self.process_status_queue)
+        # Start the event queue processor
+        self.master.after(EVENT_POLL_INTERVAL, self.process_events)
+
+        # Stop a running batch cleanly when the window is closed
+        self.master.protocol("WM_DELETE_WINDOW", self.on_close)
 
     def get_script_directory(self):
         """
@@ -104,8 +154,7 @@ class ImageStamperGUI:
 
         # ===== Logo Position =====
         tk.Label(self.master, text="Logo Position:", font=('Helvetica', 10, 'bold')).grid(row=3, column=0, sticky="e", **padding_options)
-        positions = ['bottom-right', 'bottom-left', 'top-right', 'top-left', 'center']
-        position_menu = tk.OptionMenu(self.master, self.position, *positions)
+        position_menu = tk.OptionMenu(self.master, self.position, *config.POSITIONS)
         position_menu.config(width=15)
         position_menu.grid(row=3, column=1, sticky="w", **padding_options)
 
@@ -138,30 +187,121 @@ class ImageStamperGUI:
         opacity_scale.grid(row=5, column=1, sticky="w", **padding_options)
         tk.Label(self.master, text="0 (Transparent) to 255 (Opaque)").grid(row=5, column=1, sticky="e", padx=(310, 10), pady=5)
 
-        # ===== Start Processing Button =====
-        self.start_button = tk.Button(
+        # ===== Max Output Size =====
+        tk.Label(self.master, text="Max Output Size:", font=('Helvetica', 10, 'bold')).grid(row=6, column=0, sticky="e", **padding_options)
+        max_dimension_spinbox = tk.Spinbox(
             self.master,
+            textvariable=self.max_dimension,
+            from_=0,
+            to=20000,
+            increment=256,
+            width=8
+        )
+        max_dimension_spinbox.grid(row=6, column=1, sticky="w", **padding_options)
+        tk.Label(self.master, text="Long edge in pixels (0 = original size)").grid(row=6, column=1, sticky="e", padx=(310, 10), pady=5)
+
+        # ===== Output Format =====
+        tk.Label(self.master, text="Output Format:", font=('Helvetica', 10, 'bold')).grid(row=7, column=0, sticky="e", **padding_options)
+        format_menu = tk.OptionMenu(self.master, self.output_format, *config.OUTPUT_FORMATS)
+        format_menu.config(width=15)
+        format_menu.grid(row=7, column=1, sticky="w", **padding_options)
+        quality_frame = tk.Frame(self.master)
+        quality_frame.grid(row=7, column=1, sticky="e", padx=(310, 10), pady=5)
+        tk.Label(quality_frame, text="Quality (1-100):").pack(side=tk.LEFT)
+        tk.Spinbox(quality_frame, textvariable=self.quality, from_=1, to=100, width=5).pack(side=tk.LEFT)
+
+        # ===== Encoder Options =====
+        # One frame of options per output format; only the selected format's is shown
+        tk.Label(self.master, text="Encoder Options:", font=('Helvetica', 10, 'bold')).grid(row=8, column=0, sticky="e", **padding_options)
+        encoder_frame = tk.Frame(self.master)
+        encoder_frame.grid(row=8, column=1, columnspan=2, sticky="w", **padding_options)
+        format_options_frame = tk.Frame(encoder_frame)
+        format_options_frame.pack(side=tk.LEFT)
+        self.format_options = {format_name: tk.Frame(format_options_frame) for format_name in config.OUTPUT_FORMATS}
+
+        jpeg_options = self.format_options['jpeg']
+        tk.Label(jpeg_options, text="Subsampling:").pack(side=tk.LEFT)
+        subsampling_menu = tk.OptionMenu(jpeg_options, self.jpeg_subsampling, *config.JPEG_SUBSAMPLINGS)
+        subsampling_menu.config(width=6)
+        subsampling_menu.pack(side=tk.LEFT)
+        tk.Checkbutton(jpeg_options, text="Optimize", variable=self.jpeg_optimize).pack(side=tk.LEFT, padx=(10, 0))
+        tk.Checkbutton(jpeg_options, text="Progressive", variable=self.jpeg_progressive).pack(side=tk.LEFT, padx=(10, 0))
+
+        webp_options = self.format_options['webp']
+        tk.Label(webp_options, text="Method (0 fast - 6 small):").pack(side=tk.LEFT)
+        tk.Spinbox(webp_options, textvariable=self.webp_method, from_=0, to=6, width=3).pack(side=tk.LEFT)
+        tk.Checkbutton(webp_options, text="Lossless", variable=self.webp_lossless).pack(side=tk.LEFT, padx=(10, 0))
+
+        avif_options = self.format_options['avif']
+        tk.Label(avif_options, text="Speed (0 small - 10 fast):").pack(side=tk.LEFT)
+        tk.Spinbox(avif_options, textvariable=self.avif_speed, from_=0, to=10, width=3).pack(side=tk.LEFT)
+
+        tk.Label(self.format_options['keep'], text="Each image keeps its source format").pack(side=tk.LEFT)
+
+        tk.Checkbutton(encoder_frame, text="Keep ICC Profile", variable=self.keep_icc_profile).pack(side=tk.LEFT, padx=(20, 0))
+        self.output_format.trace_add('write', lambda *args: self.show_format_options())
+        self.show_format_options()
+
+        # ===== Processing Backend =====
+        tk.Label(self.master, text="Processing Backend:", font=('Helvetica', 10, 'bold')).grid(row=9, column=0, sticky="e", **padding_options)
+        backend_menu = tk.OptionMenu(self.master, self.backend, *config.BACKENDS)
+        backend_menu.config(width=15)
+        backend_menu.grid(row=9, column=1, sticky="w", **padding_options)
+        tk.Label(self.master, text="Process: one interpreter per worker").grid(row=9, column=1, sticky="e", padx=(310, 10), pady=5)
+
+        # ===== Options =====
+        tk.Label(self.master, text="Options:", font=('Helvetica', 10, 'bold')).grid(row=10, column=0, sticky="e", **padding_options)
+        options_frame = tk.Frame(self.master)
+        options_frame.grid(row=10, column=1, columnspan=2, sticky="w", **padding_options)
+        tk.Checkbutton(options_frame, text="Include Subfolders", variable=self.recursive).pack(side=tk.LEFT)
+        tk.Checkbutton(options_frame, text="Skip Unchanged Images", variable=self.incremental).pack(side=tk.LEFT, padx=(10, 0))
+        tk.Checkbutton(options_frame, text="Link Duplicates", variable=self.dedup).pack(side=tk.LEFT, padx=(10, 0))
+        tk.Checkbutton(options_frame, text="Keep EXIF Metadata", variable=self.keep_exif).pack(side=tk.LEFT, padx=(10, 0))
+        tk.Checkbutton(options_frame, text="Export Timings (CSV)", variable=self.export_timings, onvalue='csv', offvalue='').pack(side=tk.LEFT, padx=(10, 0))
+
+        # ===== Start / Stop Processing Buttons =====
+        buttons_frame = tk.Frame(self.master)
+        buttons_frame.grid(row=11, column=1, pady=20)
+        self.start_button = tk.Button(
+            buttons_frame,
             text="Start Processing",
             command=self.start_processing,
             bg="green",
             fg="white",
             font=('Helvetica', 12, 'bold')
         )
-        self.start_button.grid(row=6, column=1, pady=20)
+        self.start_button.pack(side=tk.LEFT)
+        self.stop_button = tk.Button(
+            buttons_frame,
+            text="Stop",
+            command=self.stop_processing,
+            bg="red",
+            fg="white",
+            font=('Helvetica', 12, 'bold'),
+            state='disabled'
+        )
+        self.stop_button.pack(side=tk.LEFT, padx=(10, 0))
 
         # ===== Progress Bar =====
-        tk.Label(self.master, text="Progress:", font=('Helvetica', 10, 'bold')).grid(row=7, column=0, sticky="e", **padding_options)
+        tk.Label(self.master, text="Progress:", font=('Helvetica', 10, 'bold')).grid(row=12, column=0, sticky="e", **padding_options)
         self.progress = ttk.Progressbar(self.master, orient='horizontal', length=500, mode='determinate')
-        self.progress.grid(row=7, column=1, columnspan=2, padx=10, pady=5, sticky="ew")
+        self.progress.grid(row=12, column=1, columnspan=2, padx=10, pady=5, sticky="ew")
+
+        # ===== Status Line =====
+        self.status_text = tk.StringVar()
+        tk.Label(self.master, textvariable=self.status_text, anchor="w").grid(row=13, column=1, columnspan=2, sticky="ew", padx=10)
 
         # ===== Progress Log =====
-        tk.Label(self.master, text="Progress Log:", font=('Helvetica', 10, 'bold')).grid(row=8, column=0, sticky="ne", padx=10, pady=5)
+        log_label_frame = tk.Frame(self.master)
+        log_label_frame.grid(row=14, column=0, sticky="ne", padx=10, pady=5)
+        tk.Label(log_label_frame, text="Progress Log:", font=('Helvetica', 10, 'bold')).pack(anchor="e")
+        tk.Checkbutton(log_label_frame, text="Errors only", variable=self.errors_only, command=self.render_log).pack(anchor="e")
         self.log_text = tk.Text(self.master, height=15, width=80, state='disabled', wrap='word')  # Reduced height from 25 to 15
-        self.log_text.grid(row=8, column=1, columnspan=2, padx=10, pady=5, sticky="nsew")  # Made sticky to expand
+        self.log_text.grid(row=14, column=1, columnspan=2, padx=10, pady=5, sticky="nsew")  # Made sticky to expand
 
         # ===== Scrollbar for Progress Log =====
         scrollbar = tk.Scrollbar(self.master, command=self.log_text.yview)
-        scrollbar.grid(row=8, column=3, sticky='nsew', pady=5)
+        scrollbar.grid(row=14, column=3, sticky='nsew', pady=5)
         self.log_text['yscrollcommand'] = scrollbar.set
 
         # ===== Bind Events to Save Settings =====
@@ -174,6 +314,22 @@ class ImageStamperGUI:
         self.position.trace_add('write', lambda *args: self.save_settings())
         self.logo_size_ratio.trace_add('write', lambda *args: self.save_settings())
         self.opacity.trace_add('write', lambda *args: self.save_settings())
+        self.max_dimension.trace_add('write', lambda *args: self.save_settings())
+        self.output_format.trace_add('write', lambda *args: self.save_settings())
+        self.quality.trace_add('write', lambda *args: self.save_settings())
+        self.jpeg_subsampling.trace_add('write', lambda *args: self.save_settings())
+        self.jpeg_optimize.trace_add('write', lambda *args: self.save_settings())
+        self.jpeg_progressive.trace_add('write', lambda *args: self.save_settings())
+        self.webp_method.trace_add('write', lambda *args: self.save_settings())
+        self.webp_lossless.trace_add('write', lambda *args: self.save_settings())
+        self.avif_speed.trace_add('write', lambda *args: self.save_settings())
+        self.keep_icc_profile.trace_add('write', lambda *args: self.save_settings())
+        self.backend.trace_add('write', lambda *args: self.save_settings())
+        self.recursive.trace_add('write', lambda *args: self.save_settings())
+        self.incremental.trace_add('write', lambda *args: self.save_settings())
+        self.dedup.trace_add('write', lambda *args: self.save_settings())
+        self.keep_exif.trace_add('write', lambda *args: self.save_settings())
+        self.export_timings.trace_add('write', lambda *args: self.save_settings())
 
         self.loading_settings = False  # <--- Set flag to False after bindings
 
@@ -218,65 +374,230 @@ class ImageStamperGUI:
         # Disable the start button to prevent multiple clicks
         self.disable_start_button()
 
-        # Clear previous logs and reset progress bar
+        # Clear previous logs and reset progress bar. The total is unknown until
+        # the directory scan finishes, so start out indeterminate.
         self.clear_log()
-        self.progress['value'] = 0
+        self.open_log_file()
+        self.completed_count = 0
+        self.scan_complete = False
+        self.latest_stats = None
+        self.progress.config(mode='indeterminate', value=0)
+        self.progress.start()
+        self.status_text.set("Scanning input directory...")
+
+        import engine  # deferred: the first run loads Pillow and the worker pools
+
+        settings = self.get_settings()
+        settings['max_workers'] = self.max_workers
+        self.stamp_engine = engine.StampEngine(
+            settings,
+            log=self.log,
+            progress=lambda event: self.event_queue.put(('progress', event))
+        )
 
         # Start processing in a separate thread
         self.processing = True
-        threading.Thread(target=self.process_images, daemon=True).start()
+        threading.Thread(target=self.process_images, args=(self.stamp_engine,), daemon=True).start()
+
+    def stop_processing(self):
+        """
+        Asks the running batch to stop: images not yet started are cancelled
+        and running ones are given a few seconds to finish.
+        """
+        if not self.processing or self.stamp_engine is None:
+            return
+        self.stamp_engine.cancel()
+        self.stop_button.config(state='disabled')
+        self.status_text.set("Stopping...")
+        self.log("Stopping: cancelling queued images and letting running ones finish...")
+
+    def on_close(self):
+        """
+        Closes the window, first stopping a running batch so no work is left half done.
+        """
+        if not self.processing:
+            self.flush_settings()
+            self.master.destroy()
+            return
+        self.closing = True
+        self.stop_processing()
 
     def disable_start_button(self):
         self.start_button.config(state='disabled')
+        self.stop_button.config(state='normal')
 
     def enable_start_button(self):
         self.start_button.config(state='normal')
+        self.stop_button.config(state='disabled')
 
     def log(self, message):
         """
-        Thread-safe logging by putting messages into a queue.
+        Thread-safe logging by putting messages into the event queue.
         """
-        self.log_queue.put(message)
+        self.event_queue.put(('log', message))
 
-    def process_log_queue(self):
+    def post_status(self, action):
         """
-        Process log messages from the queue and update the log_text widget.
+        Thread-safe request for the main thread to run a status action
+        ('enable_start_button' or 'reset_processing_flag').
         """
+        self.event_queue.put(('status', action))
+
+    def process_events(self):
+        """
+        Drains the event queue and applies the events in batches: all new log
+        lines are inserted at once, progress steps are summed and only the
+        latest stats are shown, so the window stays responsive however fast
+        images complete.
+        """
+        log_messages = []
+        steps = 0
+        maximum = None
+        stats = None
+        status_actions = []
         try:
-            while True:
-                message = self.log_queue.get_nowait()
-                self.log_text.config(state='normal')
-                self.log_text.insert(tk.END, message + "\n")
-                self.log_text.see(tk.END)
-                self.log_text.config(state='disabled')
+            for _ in range(MAX_EVENTS_PER_POLL):
+                kind, value = self.event_queue.get_nowait()
+                if kind == 'log':
+                    log_messages.append(value)
+                elif kind == 'progress':
+                    command, amount = value
+                    if command == 'step':
+                        steps += amount
+                    elif command == 'set_max':
+                        maximum = amount
+                    elif command == 'stats':
+                        stats = amount
+                elif kind == 'status':
+                    status_actions.append(value)
         except queue.Empty:
             pass
+
+        try:
+            if log_messages:
+                self.append_log(log_messages)
+            if stats is not None:
+                self.latest_stats = stats
+            if steps:
+                self.step_progress(steps)
+            if maximum is not None:
+                self.set_progress_maximum(maximum)
+            elif stats is not None and not steps:
+                self.update_status_text()
+            for action in status_actions:
+                if action == 'enable_start_button':
+                    self.enable_start_button()
+                elif action == 'reset_processing_flag':
+                    self.reset_processing_flag()
         finally:
-            self.master.after(100, self.process_log_queue)
+            # reset_processing_flag destroys the window when it was closed
+            # during a run; there is nothing left to poll after that
+            if not (self.closing and not self.processing):
+                self.master.after(EVENT_POLL_INTERVAL, self.process_events)
+
+    def append_log(self, messages):
+        """
+        Adds a batch of log lines to the log file and the bounded on-screen view.
+        """
+        if self.log_file is not None:
+            try:
+                self.log_file.write("\n".join(messages) + "\n")
+                self.log_file.flush()
+            except OSError:
+                self.log_file = None
+
+        errors = [message for message in messages if is_error_line(message)]
+        self.log_lines.extend(messages)
+        self.error_lines.extend(errors)
+
+        shown = errors if self.errors_only.get() else messages
+        if not shown:
+            return
+        shown = shown[-LOG_VIEW_LINES:]
+        self.log_text.config(state='normal')
+        self.log_text.insert(tk.END, "\n".join(shown) + "\n")
+
+        # Trim the view to the newest LOG_VIEW_LINES lines (the Text widget
+        # always ends with an empty line, hence the -2)
+        excess = int(self.log_text.index('end').split('.')[0]) - 2 - LOG_VIEW_LINES
+        if excess > 0:
+            self.log_text.delete('1.0', f'{excess + 1}.0')
+        self.log_text.see(tk.END)
+        self.log_text.config(state='disabled')
+
+    def render_log(self):
+        """
+        Redraws the log view, e.g. after toggling "Errors only".
+        """
+        lines = self.error_lines if self.errors_only.get() else self.log_lines
+        self.log_text.config(state='normal')
+        self.log_text.delete(1.0, tk.END)
+        if lines:
+            self.log_text.insert(tk.END, "\n".join(lines) + "\n")
+        self.log_text.see(tk.END)
+        self.log_text.config(state='disabled')
 
     def clear_log(self):
+        self.log_lines.clear()
+        self.error_lines.clear()
         self.log_text.config(state='normal')
         self.log_text.delete(1.0, tk.END)
         self.log_text.config(state='disabled')
 
+    def open_log_file(self):
+        """
+        Starts streaming the full log of a run to LOG_FILENAME in the settings directory.
+        """
+        self.close_log_file()
+        try:
+            self.log_file = open(self.log_file_path, 'w', encoding='utf-8')
+            self.log(f"Full log: {self.log_file_path}")
+        except OSError as e:
+            self.log(f"Error opening log file: {e}")
+
+    def close_log_file(self):
+        if self.log_file is not None:
+            self.log_file.close()
+            self.log_file = None
+
     def load_settings(self):
         """
         Loads settings from settings.json and updates the GUI fields.
         """
         if os.path.exists(self.settings_path):
             try:
-                with open(self.settings_path, 'r') as f:
-                    settings = json.load(f)
+                settings = config.load_settings(self.settings_path)
 
                 # Temporarily set the loading flag to prevent save_settings from being called
                 self.loading_settings = True  # <--- Set flag before setting variables
 
-                self.input_dir.set(settings.get('input_dir', ''))
-                self.output_dir.set(settings.get('output_dir', ''))
-                self.logo_path.set(settings.get('logo_path', ''))
-                self.position.set(settings.get('position', 'bottom-right'))
-                self.logo_size_ratio.set(settings.get('logo_size_ratio', 0.15))
-                self.opacity.set(settings.get('opacity', 128))
+                self.settings = settings
+                self.input_dir.set(settings['input_dir'])
+                self.output_dir.set(settings['output_dir'])
+                self.logo_path.set(settings['logo_path'])
+                self.position.set(settings['position'])
+                self.logo_size_ratio.set(settings['logo_size_ratio'])
+                self.opacity.set(settings['opacity'])
+                self.max_dimension.set(settings['max_dimension'])
+                output_format = settings['output_format']
+                self.output_format.set(output_format if output_format in config.OUTPUT_FORMATS else 'jpeg')
+                self.quality.set(settings['quality'])
+                self.jpeg_subsampling.set(settings['jpeg_subsampling'] if settings['jpeg_subsampling'] in config.JPEG_SUBSAMPLINGS else '4:2:0')
+                self.jpeg_optimize.set(bool(settings['jpeg_optimize']))
+                self.jpeg_progressive.set(bool(settings['jpeg_progressive']))
+                self.webp_method.set(settings['webp_method'])
+                self.webp_lossless.set(bool(settings['webp_lossless']))
+                self.avif_speed.set(settings['avif_speed'])
+                self.keep_icc_profile.set(bool(settings['keep_icc_profile']))
+                backend = settings['backend']
+                self.backend.set(backend if backend in config.BACKENDS else 'thread')
+                self.recursive.set(bool(settings['recursive']))
+                self.incremental.set(bool(settings['incremental']))
+                self.dedup.set(bool(settings['dedup']))
+                self.keep_exif.set(bool(settings['keep_exif']))
+                self.export_timings.set(settings['export_timings'] if settings['export_timings'] in config.TIMINGS_FORMATS else '')
+                if settings['max_workers']:
+                    self.max_workers = settings['max_workers']
 
                 self.log(f"Loaded settings from {self.settings_path}")
             except Exception as e:
@@ -286,214 +607,191 @@ class ImageStamperGUI:
         else:
             self.log("No existing settings found. Using default values.")
 
-    def save_settings(self, *args):
+    def get_settings(self):
         """
-        Saves the current settings to settings.json.
+        Returns the settings dict for the current GUI state.
         """
-        if getattr(self, 'loading_settings', False):
-            # Don't save settings while loading to prevent race condition
-            return
-
-        settings = {
+        return {
+            **self.settings,
             'input_dir': self.input_dir.get(),
             'output_dir': self.output_dir.get(),
             'logo_path': self.logo_path.get(),
             'position': self.position.get(),
             'logo_size_ratio': self.logo_size_ratio.get(),
-            'opacity': self.opacity.get()
+            'opacity': self.opacity.get(),
+            'max_dimension': self.get_max_dimension(),
+            'output_format': self.output_format.get(),
+            'quality': self.get_quality(),
+            'jpeg_subsampling': self.jpeg_subsampling.get(),
+            'jpeg_optimize': self.jpeg_optimize.get(),
+            'jpeg_progressive': self.jpeg_progressive.get(),
+            'webp_method': self.get_bounded_int(self.webp_method, 0, 6, 'webp_method'),
+            'webp_lossless': self.webp_lossless.get(),
+            'avif_speed': self.get_bounded_int(self.avif_speed, 0, 10, 'avif_speed'),
+            'keep_icc_profile': self.keep_icc_profile.get(),
+            'backend': self.backend.get(),
+            'recursive': self.recursive.get(),
+            'incremental': self.incremental.get(),
+            'dedup': self.dedup.get(),
+            'keep_exif': self.keep_exif.get(),
+            'export_timings': self.export_timings.get()
         }
 
+    def save_settings(self, *args):
+        """
+        Schedules a write of the current settings to settings.json once they
+        have been unchanged for SETTINGS_SAVE_DELAY milliseconds.
+        """
+        if getattr(self, 'loading_settings', False):
+            # Don't save settings while loading to prevent race condition
+            return
+
+        if self.save_job is not None:
+            self.master.after_cancel(self.save_job)
+        self.save_job = self.master.after(SETTINGS_SAVE_DELAY, self.write_settings)
+
+    def flush_settings(self):
+        """
+        Writes a pending settings change now, e.g. before the window closes.
+        """
+        if self.save_job is not None:
+            self.master.after_cancel(self.save_job)
+            self.write_settings()
+
+    def write_settings(self):
+        """
+        Writes the current settings to settings.json.
+        """
+        self.save_job = None
         try:
-            with open(self.settings_path, 'w') as f:
-                json.dump(settings, f, indent=4)
+            config.save_settings(self.settings_path, self.get_settings())
             # Avoid logging every save to reduce clutter
             # self.log(f"Settings saved to {self.settings_path}")
         except Exception as e:
             self.log(f"Error saving settings: {e}")
 
-    def reset_processing_flag(self):
-        self.processing = False
-
-    def process_images(self):
-        input_dir = self.input_dir.get()
-        output_dir = self.output_dir.get()
-        logo_path = self.logo_path.get()
-        position = self.position.get()
-        logo_size_ratio = self.logo_size_ratio.get()
-        opacity = self.opacity.get()
+    def report_startup_time(self):
+        """
+        Logs how long the app took from launch until the window was ready,
+        flagging starts slower than startup.STARTUP_TARGET, and appends it to
+        STARTUP_LOG_FILENAME in the settings directory so slow launches can be tracked.
+        """
+        seconds = startup.startup_seconds()
+        if seconds > startup.STARTUP_TARGET:
+            self.log(f"⚠️ Slow start: ready in {seconds:.2f}s (target {startup.STARTUP_TARGET:.1f}s)")
+        else:
+            self.log(f"Ready in {seconds:.2f}s (target {startup.STARTUP_TARGET:.1f}s)")
+        try:
+            startup.record_startup(os.path.join(os.path.dirname(self.settings_path), startup.STARTUP_LOG_FILENAME), seconds)
+        except OSError as e:
+            self.log(f"Error recording start-up time: {e}")
 
-        # Ensure output directory exists
+    def get_max_dimension(self):
+        """
+        Returns the max output size, treating an empty or invalid entry as 0 (original size).
+        """
         try:
-            os.makedirs(output_dir, exist_ok=True)
-            self.log(f"Output directory ensured at: {output_dir}")
-        except Exception as e:
-            self.log(f"Error ensuring output directory: {e}")
-            self.status_queue.put('enable_start_button')
-            self.status_queue.put('reset_processing_flag')
-            return
+            return max(0, self.max_dimension.get())
+        except tk.TclError:
+            return 0
 
-        # Load the logo image
+    def get_quality(self):
+        """
+        Returns the output quality clamped to 1-100, keeping the saved value while the entry is invalid.
+        """
         try:
-            logo = Image.open(logo_path).convert("RGBA")
-            self.log(f"Loaded logo from: {logo_path}")
-        except Exception as e:
-            self.log(f"Error loading logo: {e}")
-            self.status_queue.put('enable_start_button')
-            self.status_queue.put('reset_processing_flag')
-            return
+            return min(100, max(1, self.quality.get()))
+        except tk.TclError:
+            return self.settings['quality']
 
-        supported_extensions = ('.png', '.jpg', '.jpeg', '.bmp', '.gif')
+    def get_bounded_int(self, variable, low, high, key):
+        """
+        Returns a Spinbox value clamped to low-high, keeping the saved settings[key] while the entry is invalid.
+        """
         try:
-            all_files = [f for f in os.listdir(input_dir) if f.lower().endswith(supported_extensions) and os.path.isfile(os.path.join(input_dir, f))]
-        except Exception as e:
-            self.log(f"Error accessing input directory: {e}")
-            self.status_queue.put('enable_start_button')
-            self.status_queue.put('reset_processing_flag')
-            return
+            return min(high, max(low, variable.get()))
+        except tk.TclError:
+            return self.settings[key]
 
-        total_files = len(all_files)
+    def show_format_options(self):
+        """
+        Shows the encoder options of the selected output format.
+        """
+        for format_name, frame in self.format_options.items():
+            if format_name == self.output_format.get():
+                frame.pack(side=tk.LEFT)
+            else:
+                frame.pack_forget()
 
-        if total_files == 0:
-            self.log("No supported images found in the input directory.")
-            self.status_queue.put('enable_start_button')
-            self.status_queue.put('reset_processing_flag')
+    def reset_processing_flag(self):
+        self.processing = False
+        self.stamp_engine = None
+        self.close_log_file()
+        if self.closing:
+            self.flush_settings()
+            self.master.destroy()
             return
 
-        self.log(f"Found {total_files} supported image(s) in the input directory.")
-        self.progress_queue.put(('set_max', total_files))
-
-        # Initialize ThreadPoolExecutor
-        self.executor = ThreadPoolExecutor(max_workers=self.max_workers)
-        futures = []
+        # Runs that stop before the scan finishes leave the bar indeterminate
+        if self.progress['mode'] == 'indeterminate':
+            self.progress.stop()
+            self.progress.config(mode='determinate', value=0)
 
-        for filename in all_files:
-            input_path = os.path.join(input_dir, filename)
-            futures.append(self.executor.submit(
-                self.process_single_image, input_path, output_dir, logo, position, logo_size_ratio, opacity
-            ))
+    def process_images(self, stamp_engine):
+        import engine
 
-        for future in as_completed(futures):
-            try:
-                future.result()  # This will re-raise any exception occurred in the thread
-            except Exception as e:
-                self.log(f"❌ Unexpected error: {e}")
-
-        # Shutdown the executor
-        self.executor.shutdown(wait=True)
+        summary = stamp_engine.run()
 
         # Communicate completion to the main thread
-        self.status_queue.put(f'log:🎉 Processing completed: {total_files} image(s) processed.')
-        self.status_queue.put('enable_start_button')
-        self.status_queue.put('reset_processing_flag')
-
-    def process_single_image(self, input_path, output_dir, logo, position, logo_size_ratio, opacity):
-        filename = os.path.basename(input_path)
-        try:
-            with Image.open(input_path) as base_image:
-                # Apply EXIF transpose to correct orientation
-                base_image = ImageOps.exif_transpose(base_image).convert("RGBA")
-                base_width, base_height = base_image.size
-
-                # Calculate logo size
-                logo_size = int(min(base_width, base_height) * logo_size_ratio)
-                logo_ratio = logo.width / logo.height
-                logo_new_size = (logo_size, int(logo_size / logo_ratio))
-                logo_resized = logo.resize(logo_new_size, Image.Resampling.LANCZOS)
-
-                # Adjust logo opacity
-                if opacity < 255:
-                    # Split the alpha channel and adjust opacity
-                    alpha = logo_resized.split()[3]
-                    alpha = alpha.point(lambda p: p * opacity // 255)
-                    logo_resized.putalpha(alpha)
-
-                # Determine position
-                if position == 'bottom-right':
-                    pos = (base_width - logo_resized.width - 10, base_height - logo_resized.height - 10)
-                elif position == 'bottom-left':
-                    pos = (10, base_height - logo_resized.height - 10)
-                elif position == 'top-right':
-                    pos = (base_width - logo_resized.width - 10, 10)
-                elif position == 'top-left':
-                    pos = (10, 10)
-                elif position == 'center':
-                    pos = ((base_width - logo_resized.width) // 2, (base_height - logo_resized.height) // 2)
-                else:
-                    raise ValueError("Invalid position argument")
-
-                # Create a new image for compositing
-                composite = Image.new("RGBA", base_image.size)
-                composite.paste(base_image, (0, 0))
-                composite.paste(logo_resized, pos, logo_resized)
-
-                # Convert to RGB (JPEG does not support alpha channels)
-                composite = composite.convert("RGB")
-
-                # Prepare output filename with .jpg extension
-                base_filename, _ = os.path.splitext(filename)
-                output_filename = f"{base_filename}.jpg"
-                output_path = os.path.join(output_dir, output_filename)
-
-                # Save the image as JPEG
-                composite.save(output_path, format='JPEG', quality=100)  # Adjust quality as needed
-
-                # Update progress bar via queue
-                self.progress_queue.put(('step', 1))
-
-                # Log success
-                self.log(f"✅ Added logo to '{filename}' and saved as '{output_filename}'.")
-
-        except Exception as e:
-            # Update progress bar via queue
-            self.progress_queue.put(('step', 1))
-
-            # Log failure
-            self.log(f"❌ Failed to process '{filename}': {e}")
-
-    def update_progress(self):
+        if summary is not None and summary['stopped']:
+            self.log(f"🛑 Processing cancelled: {engine.format_summary(summary)}.")
+        elif summary is not None and summary['aborted']:
+            self.log(f"❌ Processing aborted: {engine.format_summary(summary)}.")
+        elif summary is not None:
+            self.log(f"🎉 Processing completed: {engine.format_summary(summary)}.")
+        self.post_status('enable_start_button')
+        self.post_status('reset_processing_flag')
+
+    def set_progress_maximum(self, total):
         """
-        Updates the progress bar based on messages from the progress_queue.
+        Called once the directory scan has finished: switches the progress bar
+        from indeterminate to determinate, catching up with completed images.
         """
-        try:
-            while True:
-                message = self.progress_queue.get_nowait()
-                if isinstance(message, tuple):
-                    command, value = message
-                    if command == 'set_max':
-                        self.progress['maximum'] = value
-                    elif command == 'step':
-                        self.progress.step(value)
-                else:
-                    self.progress.step(message)
-        except queue.Empty:
-            pass
-        finally:
-            self.master.after(100, self.update_progress)
-
-    def process_status_queue(self):
+        self.scan_complete = True
+        self.progress.stop()
+        self.progress.config(mode='determinate', maximum=total, value=self.completed_count)
+        self.update_status_text()
+
+    def step_progress(self, value):
+        self.completed_count += value
+        if self.scan_complete:
+            self.progress['value'] = self.completed_count
+        self.update_status_text()
+
+    def update_status_text(self):
         """
-        Processes status updates from the status_queue and performs actions in the main thread.
+        Shows the image count and the engine's latest throughput figures under the progress bar.
         """
-        try:
-            while True:
-                message = self.status_queue.get_nowait()
-                if isinstance(message, str):
-                    if message == 'enable_start_button':
-                        self.enable_start_button()
-                    elif message == 'reset_processing_flag':
-                        self.reset_processing_flag()
-                    elif message.startswith('log:'):
-                        log_message = message[4:]
-                        self.log(log_message)
-        except queue.Empty:
-            pass
-        finally:
-            self.master.after(100, self.process_status_queue)
+        if self.scan_complete:
+            status = f"{self.completed_count} of {int(self.progress['maximum'])} image(s)"
+        else:
+            status = f"{self.completed_count} image(s), still scanning..."
+        if self.latest_stats is not None:
+            import engine  # already loaded by the run reporting these stats
+            status += " | " + engine.format_stats(self.latest_stats)
+        self.status_text.set(status)
 
 def main():
     root = tk.Tk()
     app = ImageStamperGUI(root)
+    # Runs once the window has been drawn and the event loop is idle
+    root.after_idle(app.report_startup_time)
     root.mainloop()
 
 if __name__ == "__main__":
+    # Required for the process backend in PyInstaller-frozen executables
+    # (a no-op otherwise, so multiprocessing is only imported when frozen)
+    if getattr(sys, 'frozen', False):
+        import multiprocessing
+        multiprocessing.freeze_support()
     main()
@@ -0,0 +1,111 @@
+"""
+Manifest of completed outputs, used by incremental runs to skip sources whose
+inputs and settings have not changed since they were last stamped.
+
+The manifest lives in the output directory as JSON lines. Each completed image
+is appended (and flushed) as soon as it is written, so an interrupted run can
+resume where it stopped. The file is compacted to one line per source when a
+run finishes.
+"""
+import os
+import json
+import hashlib
+import threading
+
+MANIFEST_FILENAME = ".imagestamper-manifest.jsonl"
+
+HASH_CHUNK_SIZE = 1024 * 1024
+
+
+def hash_file(path):
+    """
+    Returns the BLAKE2b hex digest of a file, read in chunks.
+    """
+    digest = hashlib.blake2b(digest_size=16)
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def hash_settings(settings, keys):
+    """
+    Returns a short hash of the given settings keys, so any change to a
+    setting that affects the output invalidates the manifest entries.
+    """
+    relevant = {key: settings[key] for key in keys}
+    return hashlib.blake2b(json.dumps(relevant, sort_keys=True).encode('utf-8'), digest_size=16).hexdigest()
+
+
+class Manifest:
+    """
+    Thread-safe record of completed outputs, keyed by the source path
+    relative to the input directory.
+    """
+
+    def __init__(self, output_dir):
+        self.output_dir = output_dir
+        self.path = os.path.join(output_dir, MANIFEST_FILENAME)
+        self.entries = {}
+        self._lock = threading.Lock()
+        self._file = None
+
+    def load(self):
+        """
+        Reads existing entries. A truncated last line (from a run that was
+        killed mid-write) is ignored; later lines win over earlier ones.
+        """
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                    self.entries[entry['source']] = entry
+                except (ValueError, KeyError, TypeError):
+                    continue
+
+    def is_current(self, entry):
+        """
+        True if the stored entry for this source matches the given one
+        (size, mtime or content hash, settings and logo) and its outputs still exist.
+        """
+        with self._lock:
+            stored = self.entries.get(entry['source'])
+        if stored is None:
+            return False
+        for key in ('size', 'mtime_ns', 'content_hash', 'settings_hash', 'logo_hash'):
+            if stored.get(key) != entry.get(key):
+                return False
+        # Entries from older runs record a single 'output'
+        outputs = stored['outputs'] if 'outputs' in stored else [stored['output']]
+        return all(os.path.exists(os.path.join(self.output_dir, output)) for output in outputs)
+
+    def record(self, entry):
+        """
+        Stores a completed output and appends it to the manifest file immediately.
+        """
+        line = json.dumps(entry, sort_keys=True) + "\n"
+        with self._lock:
+            self.entries[entry['source']] = entry
+            if self._file is None:
+                self._file = open(self.path, 'a', encoding='utf-8')
+            self._file.write(line)
+            self._file.flush()
+
+    def close(self):
+        """
+        Compacts the manifest to one line per source.
+        """
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+            if not self.entries:
+                return
+
+            temp_path = self.path + ".tmp"
+            with open(temp_path, 'w', encoding='utf-8') as f:
+                for entry in self.entries.values():
+                    f.write(json.dumps(entry, sort_keys=True) + "\n")
+            os.replace(temp_path, self.path)
@@ -0,0 +1,105 @@
+"""
+Cold-start measurement for the desktop app: the time from the process being
+launched to the window being ready. On Linux and Windows this includes
+interpreter startup and, for one-file PyInstaller executables, unpacking the
+bundle; elsewhere (e.g. macOS) it starts when this module is imported.
+Imported first by main.py and kept free of heavy imports so it doesn't slow
+down what it measures.
+"""
+import os
+import sys
+import time
+
+# Cold starts slower than this many seconds are flagged in the log
+STARTUP_TARGET = 2.0
+
+# Every cold start is appended to this CSV file in the settings directory
+STARTUP_LOG_FILENAME = "startup-times.csv"
+
+# When this module was imported; the fallback start time where the OS doesn't
+# report when the process started (it misses interpreter startup)
+IMPORT_TIME = time.time()
+
+
+def process_start_time(pid):
+    """
+    Returns when process pid started, in seconds since the epoch, or None if
+    the OS doesn't report it. Uses /proc on Linux and GetProcessTimes on Windows.
+    """
+    try:
+        if sys.platform.startswith('linux'):
+            with open(f"/proc/{pid}/stat", 'r') as f:
+                # The command name (field 2) may contain spaces, so split after it
+                fields = f.read().rsplit(')', 1)[1].split()
+            with open("/proc/uptime", 'r') as f:
+                uptime = float(f.read().split()[0])
+            # starttime (field 22) is in clock ticks since boot
+            started_after_boot = int(fields[19]) / os.sysconf('SC_CLK_TCK')
+            return time.time() - uptime + started_after_boot
+        if sys.platform == 'win32':
+            import ctypes
+            from ctypes import wintypes
+            kernel32 = ctypes.WinDLL('kernel32', use_last_error=True)
+            kernel32.OpenProcess.restype = wintypes.HANDLE
+            process_query_limited_information = 0x1000
+            handle = kernel32.OpenProcess(process_query_limited_information, False, pid)
+            if not handle:
+                return None
+            try:
+                creation, exited, kernel, user = (wintypes.FILETIME() for _ in range(4))
+                if not kernel32.GetProcessTimes(handle, ctypes.byref(creation), ctypes.byref(exited), ctypes.byref(kernel), ctypes.byref(user)):
+                    return None
+            finally:
+                kernel32.CloseHandle(handle)
+            # FILETIME counts 100 ns intervals since 1601-01-01
+            intervals = (creation.dwHighDateTime << 32) | creation.dwLowDateTime
+            return intervals / 10_000_000 - 11644473600
+    except (OSError, ValueError, IndexError, AttributeError):
+        pass
+    return None
+
+
+def is_onefile_bundle():
+    """
+    True in a one-file PyInstaller executable, where a bootloader process
+    unpacks the bundle to a temporary _MEIxxxxxx directory and starts the app
+    as its child.
+    """
+    bundle_dir = getattr(sys, '_MEIPASS', None)
+    return bool(getattr(sys, 'frozen', False) and bundle_dir and os.path.basename(bundle_dir).startswith('_MEI'))
+
+
+def launch_time():
+    """
+    Returns when the app was launched, in seconds since the epoch: the
+    bootloader's start time for one-file executables, this process's
+    otherwise, falling back to IMPORT_TIME.
+    """
+    started = None
+    if is_onefile_bundle():
+        started = process_start_time(os.getppid())
+    if started is None:
+        started = process_start_time(os.getpid())
+    if started is None or started > IMPORT_TIME:
+        started = IMPORT_TIME
+    return started
+
+
+def startup_seconds():
+    """
+    Seconds from launch until now. Call it once the window is ready.
+    """
+    return time.time() - launch_time()
+
+
+def record_startup(log_path, seconds):
+    """
+    Appends a cold start to the CSV file at log_path (time, seconds, target,
+    whether the app was a packaged executable), writing a header for new files.
+    """
+    new_file = not os.path.exists(log_path)
+    with open(log_path, 'a', encoding='utf-8') as f:
+        if new_file:
+            f.write("time,seconds,target,frozen\n")
+        launched = time.strftime('%Y-%m-%dT%H:%M:%S', time.localtime(launch_time()))
+        f.write(f"{launched},{seconds:.3f},{STARTUP_TARGET},{bool(getattr(sys, 'frozen', False))}\n")